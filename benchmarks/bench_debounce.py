@@ -0,0 +1,104 @@
+"""
+Benchmark للمعالجة التلقائية بعد السكون مع 10 آلاف محادثة وهمية.
+يقارن الطريقة القديمة (إلغاء Task وإنشاء Task نايمة مع كل رسالة) بـ DebounceScheduler،
+ويقيس وقت المعالج وأعلى ذاكرة وعدد الـ Tasks، ويتأكد إن كل محادثة انعالجت مرة وحدة.
+
+التشغيل:
+    python benchmarks/bench_debounce.py [--chats 10000] [--messages 20] [--window 3] [--delay 10]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheduler import DebounceScheduler  # noqa: E402
+
+
+class TaskPerMessage:
+    """نفس منطق handle_text القديم: TIMERS[chat_id] = create_task(sleep ثم finalize)."""
+
+    def __init__(self, delay, handler):
+        self.delay = delay
+        self.handler = handler
+        self.timers = {}
+
+    async def _run(self, chat_id, data):
+        await asyncio.sleep(self.delay)
+        self.timers.pop(chat_id, None)
+        await self.handler(chat_id, data)
+
+    def schedule(self, chat_id, data=None):
+        old = self.timers.get(chat_id)
+        if old:
+            old.cancel()
+        self.timers[chat_id] = asyncio.create_task(self._run(chat_id, data))
+
+    async def stop(self):
+        pass
+
+
+async def simulate(make, args):
+    finalized = {}
+
+    async def handler(chat_id, data):
+        finalized[chat_id] = finalized.get(chat_id, 0) + 1
+
+    scheduler = make(args.delay, handler)
+    rnd = random.Random(args.seed)
+    # كل رسالة: (وقت الوصول، المحادثة). النافذة أقصر من delay، فكل محادثة لازم تنعالج مرة وحدة بالضبط
+    events = sorted(
+        (rnd.random() * args.window, chat_id)
+        for chat_id in range(args.chats)
+        for _ in range(args.messages)
+    )
+
+    loop = asyncio.get_running_loop()
+    tracemalloc.start()
+    cpu0 = time.process_time()
+    start = loop.time()
+    peak_tasks = 0
+    for i, (at, chat_id) in enumerate(events):
+        # النوم أقصر من دقة الـ event loop (~1ms) يبطئ المحاكاة، فنجمع الرسائل القريبة
+        delay = start + at - loop.time()
+        if delay > 0.005:
+            await asyncio.sleep(delay)
+        scheduler.schedule(chat_id)
+        if i % 1000 == 0:
+            peak_tasks = max(peak_tasks, len(asyncio.all_tasks()))
+
+    while len(finalized) < args.chats:
+        await asyncio.sleep(0.01)
+    cpu = time.process_time() - cpu0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    await scheduler.stop()
+
+    dupes = sum(1 for n in finalized.values() if n != 1)
+    return cpu, peak, peak_tasks, len(finalized), dupes
+
+
+async def main_bench(args):
+    total = args.chats * args.messages
+    print(f"{args.chats} chats, {total} messages over {args.window}s, delay {args.delay}s")
+    print(f"{'approach':>16} {'cpu s':>8} {'peak MiB':>9} {'tasks':>7} {'finalized':>10} {'dupes':>6}")
+    for name, make in (
+        ("task-per-msg", TaskPerMessage),
+        ("scheduler", lambda d, h: DebounceScheduler(d, h, workers=8)),
+    ):
+        cpu, peak, tasks, finalized, dupes = await simulate(make, args)
+        print(f"{name:>16} {cpu:>8.2f} {peak / 2**20:>9.1f} {tasks:>7} {finalized:>10} {dupes:>6}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=10000)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--window", type=float, default=3.0)
+    parser.add_argument("--delay", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main_bench(parser.parse_args()))
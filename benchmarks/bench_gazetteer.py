@@ -0,0 +1,129 @@
+"""
+Benchmark لدليل المحافظات والأقضية: نكبر الدليل بأسماء مصطنعة لحد عشرات الآلاف
+ونقيس زمن البناء وزمن locate لكل طلب، مقابل بحث بسيط يمر على كل الأسماء (substring).
+زمن الـ trie لازم يبقى ثابت تقريبًا مع حجم الدليل، والبحث البسيط يكبر معه.
+يتأكد كذلك إن الأسماء المضافة ما غيرت نتائج الطلبات الحقيقية.
+
+التشغيل:
+    python benchmarks/bench_gazetteer.py [--sizes 1000,5000,20000,100000] [--orders 2000] [--naive-max 20000]
+"""
+import os
+import sys
+import copy
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gazetteer import Gazetteer, normalize  # noqa: E402
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "gazetteer_iq.json")
+LETTERS = "ابتثجحخدذرزسشصضطظعغفقكلمنهوي"
+FILLER = ["قرب", "شارع", "بيت", "مقابل", "جامع", "محل", "الطابق", "الثاني", "اتصل", "قبل", "التوصيل", "لونين"]
+NAMES = ["علي حسين", "زينب كاظم", "محمد جاسم", "فاطمة عباس", "حيدر سلمان", "نور الهدى"]
+
+
+def synthetic_name(rnd):
+    words = rnd.randint(1, 3)
+    return " ".join("".join(rnd.choice(LETTERS) for _ in range(rnd.randint(4, 8))) for _ in range(words))
+
+
+def grow(data, size, rnd):
+    """نضيف أقضية مصطنعة لمحافظات عشوائية لحد ما يصير عدد الأسماء size."""
+    data = copy.deepcopy(data)
+    governorates = list(data)
+    count = sum(1 + len(v["aliases"]) + sum(1 + len(a) for a in v["districts"].values()) for v in data.values())
+    while count < size:
+        data[rnd.choice(governorates)]["districts"][synthetic_name(rnd)] = []
+        count += 1
+    return data
+
+
+def make_orders(data, n, rnd):
+    places = [(g, d) for g, v in data.items() for d in [""] + list(v["districts"])]
+    orders = []
+    for _ in range(n):
+        governorate, district = rnd.choice(places)
+        words = [rnd.choice(FILLER) for _ in range(rnd.randint(3, 10))]
+        where = f"{governorate} {district}".strip() if rnd.random() < 0.7 else district or governorate
+        words.insert(rnd.randint(0, len(words)), where)
+        digits = "".join(rnd.choice("0123456789") for _ in range(9))
+        orders.append(f"اسم: {rnd.choice(NAMES)}\n07{digits}\n{' '.join(words)}\nمبلغ {rnd.randint(5, 200) * 1000}")
+    return orders
+
+
+class NaiveGazetteer:
+    """البديل البسيط: نمر على كل الأسماء ونفحص وجودها بالنص."""
+
+    def __init__(self, data):
+        self.names = []
+        for governorate, info in data.items():
+            for name in [governorate, *info["aliases"]]:
+                self.names.append((normalize(name), governorate, ""))
+            for district, aliases in info["districts"].items():
+                for name in [district, *aliases]:
+                    self.names.append((normalize(name), governorate, district))
+
+    def locate(self, text):
+        text = normalize(text)
+        governorate = district = ""
+        for name, g, d in self.names:
+            if name in text:
+                if d and not district:
+                    district, governorate = d, governorate or g
+                elif not d and not governorate:
+                    governorate = g
+        return governorate, district
+
+
+def per_order(fn, orders):
+    start = time.perf_counter()
+    for text in orders:
+        fn(text)
+    return (time.perf_counter() - start) / len(orders) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,5000,20000,100000")
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--naive-max", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    with open(DATA_PATH, encoding="utf-8") as f:
+        bundled = json.load(f)
+    orders = make_orders(bundled, args.orders, rnd)
+
+    base = Gazetteer(bundled)
+    expected = [base.locate(text) for text in orders]
+    found = sum(1 for c, d in expected if c)
+    print(f"orders: {len(orders)}, with a place found: {found}")
+    print(f"{'names':>8} {'variants':>9} {'build ms':>9} {'trie us/order':>14} {'naive us/order':>15}")
+
+    sizes = [0] + [int(s) for s in args.sizes.split(",")]
+    for size in sizes:
+        data = grow(bundled, size, rnd) if size else bundled
+        start = time.perf_counter()
+        gazetteer = Gazetteer(data)
+        build = (time.perf_counter() - start) * 1000
+
+        # الأسماء المصطنعة ما لازم تغير نتيجة أي طلب
+        results = [gazetteer.locate(text) for text in orders]
+        if results != expected:
+            bad = sum(1 for a, b in zip(results, expected) if a != b)
+            raise SystemExit(f"size {size}: {bad} orders changed")
+
+        trie = per_order(gazetteer.locate, orders)
+        naive = "-"
+        if size <= args.naive_max:
+            naive = f"{per_order(NaiveGazetteer(data).locate, orders):,.1f}"
+        label = size or "bundled"
+        print(f"{label:>8} {gazetteer.size:>9,} {build:>9.1f} {trie:>14.1f} {naive:>15}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+قياس للتحليل التدريجي (OrderStream): زمن /done بـ finish() مقابل parse_orders للنص كامل.
+فحص التطابق مع تقطيع عشوائي للرسائل بـ tests/test_incremental.py.
+
+التشغيل:
+    python benchmarks/bench_incremental.py [--orders 10000] [--messages 200] [--seed 1]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "bench")
+os.environ.setdefault("WEBHOOK_SECRET", "bench")
+
+import main  # noqa: E402
+from bench_parse import make_paste  # noqa: E402
+
+
+def random_messages(text, count, rnd):
+    """تقطيع النص لرسائل مثل ما توصل لـ handle_text (مقصوصة وغير فارغة)."""
+    cuts = sorted(rnd.sample(range(1, len(text)), min(count - 1, len(text) - 1)))
+    parts = [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+    return [p.strip() for p in parts if p.strip()]
+
+
+def stream_orders(messages):
+    stream = main.OrderStream()
+    for msg in messages:
+        stream.feed(msg)
+    return stream
+
+
+def bench(orders, messages, seed):
+    rnd = random.Random(seed)
+    msgs = random_messages(make_paste(orders, seed), messages, rnd)
+
+    t0 = time.perf_counter()
+    stream = stream_orders(msgs)
+    feed = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    result = stream.finish()
+    finish = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    expected = main.parse_orders("\n".join(msgs).strip())
+    batch = time.perf_counter() - t0
+
+    assert result == expected
+    print(f"{len(result)} orders in {len(msgs)} messages")
+    print(f"feed per message (ms): {feed / len(msgs) * 1000:.2f}")
+    print(f"/done incremental (ms): {finish * 1000:.2f}")
+    print(f"/done batch (ms):       {batch * 1000:.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=10000)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    bench(args.orders, args.messages, args.seed)
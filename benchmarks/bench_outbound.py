@@ -0,0 +1,125 @@
+"""
+Benchmark لطابور الإرسال مع Bot وهمي.
+محادثات كثيرة ترسل رسائل خلال فترة قصيرة، وبعد آخر رسالة بكل محادثة تنرسل نتيجة /done.
+يقارن عدد طلبات Bot API بين الطريقة القديمة (رد لكل رسالة) وإشعار الاستلام المجمع،
+ويقيس زمن وصول النتائج (أولوية عالية) وتأخر آخر إشعار (أولوية منخفضة) p50/p99،
+ويتأكد إن ما فيه محادثة تجاوزت حدها بالثانية.
+
+التشغيل:
+    python benchmarks/bench_outbound.py [--chats 200] [--messages 20] [--duration 5] [--global-rate 30]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from outbound import AckCoalescer, OutboundQueue  # noqa: E402
+
+
+class FakeMessage:
+    def __init__(self, message_id):
+        self.message_id = message_id
+
+
+class FakeBot:
+    """يسجل كل طلب (المحادثة، النص، الوقت) بتأخير ثابت مثل الشبكة."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = []
+
+    async def _call(self, chat_id, text):
+        self.calls.append((chat_id, text, time.perf_counter()))
+        await asyncio.sleep(self.latency)
+        return FakeMessage(len(self.calls))
+
+    async def send_message(self, chat_id, text, **kwargs):
+        return await self._call(chat_id, text)
+
+    async def edit_message_text(self, text, chat_id, message_id, **kwargs):
+        return await self._call(chat_id, text)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def render(messages, orders, full=False):
+    return f"📥 {messages}"
+
+
+async def run(args):
+    bot = FakeBot(args.api_latency)
+    queue = OutboundQueue(global_rate=args.global_rate, chat_rate=args.chat_rate)
+    acks = AckCoalescer(queue, render)
+
+    last_note = {}
+    result_latency = []
+
+    async def chat(chat_id):
+        times = sorted(random.uniform(0, args.duration) for _ in range(args.messages))
+        start = time.perf_counter()
+        for count, at in enumerate(times, 1):
+            await asyncio.sleep(max(0.0, start + at - time.perf_counter()))
+            acks.note(bot, chat_id, count)
+            last_note[chat_id] = time.perf_counter()
+
+        t = time.perf_counter()
+        await queue.via(bot).send_message(chat_id, text="result")
+        result_latency.append(time.perf_counter() - t)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(chat(c) for c in range(1, args.chats + 1)))
+    # ننتظر آخر إشعار لكل محادثة
+    final = render(args.messages, None)
+    while sum(1 for _, text, _ in bot.calls if text == final) < args.chats:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - t0
+    await queue.stop()
+
+    ack_lag = [
+        at - last_note[chat_id] for chat_id, text, at in bot.calls if text == final
+    ]
+
+    per_chat = defaultdict(list)
+    for chat_id, _, at in bot.calls:
+        per_chat[chat_id].append(at)
+    # أكثر عدد طلبات لنفس المحادثة خلال ثانية وحدة (الحد = burst + rate)
+    worst = 0
+    for times in per_chat.values():
+        j = 0
+        for i, at in enumerate(times):
+            while times[j] < at - 1.0:
+                j += 1
+            worst = max(worst, i - j + 1)
+
+    old_calls = args.chats * (args.messages + 1)
+    new_calls = len(bot.calls)
+    print(f"chats x messages:         {args.chats} x {args.messages}")
+    print(f"API calls (old):          {old_calls:,}")
+    print(f"API calls (coalesced):    {new_calls:,} ({100 * (1 - new_calls / old_calls):.0f}% fewer)")
+    print(f"old drain time @ {args.global_rate:g}/s:   {old_calls / args.global_rate:.1f} s")
+    print(f"total time (coalesced):   {elapsed:.1f} s")
+    print(f"result wait p50/p99 (ms): {percentile(result_latency, 0.5) * 1000:.0f} / {percentile(result_latency, 0.99) * 1000:.0f}")
+    print(f"last ack lag p50/p99 (s): {percentile(ack_lag, 0.5):.2f} / {percentile(ack_lag, 0.99):.2f}")
+    print(f"max calls/chat in 1 s:    {worst}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--global-rate", type=float, default=30)
+    parser.add_argument("--chat-rate", type=float, default=1)
+    parser.add_argument("--api-latency", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    asyncio.run(run(args))
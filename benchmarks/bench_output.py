@@ -0,0 +1,74 @@
+"""
+Benchmark لطبقة الإخراج (delivery.py): زمن التحويل وحجم الناتج لدفعات كبيرة
+لكل وضع، مقارنة بالطريقة القديمة json.dumps(indent=2) برسالة وحدة.
+
+التشغيل:
+    python benchmarks/bench_output.py [--sizes 50,500,5000,50000]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "bench")
+os.environ.setdefault("WEBHOOK_SECRET", "bench")
+
+import main  # noqa: E402
+import delivery  # noqa: E402
+from bench_parse import make_paste  # noqa: E402
+
+HEADER = "✅ تم تحليل الرسائل.\nعدد الطلبات المستخرجة: 0"
+
+
+def legacy(orders):
+    pretty = json.dumps(orders, ensure_ascii=False, indent=2)
+    return [f"{HEADER}\n\n```json\n{pretty}\n```"]
+
+
+def chunks(orders):
+    return delivery.render_chunks(HEADER, delivery.order_lines(orders))
+
+
+def summary(orders):
+    return delivery.render_summary(HEADER, orders)
+
+
+def document(fmt):
+    return lambda orders: [delivery.render_document(orders, fmt)]
+
+
+MODES = {
+    "legacy": legacy,
+    "chunks": chunks,
+    "summary": summary,
+    "json": document("json"),
+    "jsonl": document("jsonl"),
+    "csv": document("csv"),
+}
+
+
+def payload_size(parts):
+    return sum(len(p.encode("utf-8")) if isinstance(p, str) else len(p) for p in parts)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="50,500,5000,50000")
+    args = parser.parse_args()
+
+    print(f"{'orders':>7} {'mode':>8} {'ms':>9} {'KiB':>9} {'messages':>9} {'fits':>5}")
+    for n in (int(x) for x in args.sizes.split(",")):
+        orders = main.parse_orders(make_paste(n, n))
+        for name, fn in MODES.items():
+            t0 = time.perf_counter()
+            parts = fn(orders)
+            ms = (time.perf_counter() - t0) * 1000
+            texts = [p for p in parts if isinstance(p, str)]
+            fits = all(delivery.tg_len(t) <= delivery.TELEGRAM_MAX_MESSAGE for t in texts)
+            print(
+                f"{len(orders):>7} {name:>8} {ms:>9.1f} {payload_size(parts) / 1024:>9.1f} "
+                f"{len(texts) if texts else 1:>9} {'yes' if fits else 'NO':>5}"
+            )
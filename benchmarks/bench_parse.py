@@ -0,0 +1,150 @@
+"""
+Benchmark لمحلل الطلبات: لصقات عربية مصطنعة من 100 إلى 50 ألف طلب.
+يتأكد إن main.parse_orders (tokenizer بمرور واحد) يطابق المحلل القديم المحفوظ هنا كمرجع
+(تقسيم بأرقام الهواتف ثم re.search لكل حقل) ويطبع عدد الطلبات بالثانية وأعلى استهلاك ذاكرة.
+
+التشغيل:
+    python benchmarks/bench_parse.py [--sizes 100,1000,10000,50000] [--seed 1]
+"""
+import os
+import re
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "bench")
+os.environ.setdefault("WEBHOOK_SECRET", "bench")
+
+import main  # noqa: E402
+
+NAMES = ["علي حسين", "زينب كاظم", "محمد جاسم", "فاطمة عباس", "حيدر سلمان", "نور الهدى"]
+CITIES = ["بغداد", "البصرة", "النجف", "اربيل", "كربلاء", "الموصل"]
+DISTRICTS = ["الكرادة", "المنصور", "الزبير", "الكوفة", "عين كاوة", "الاعظمية"]
+NOTES = ["اتصل قبل التوصيل", "قياس XL", "لونين", "التوصيل مساءً", ""]
+
+
+# =========================
+# المحلل القديم (مرجع للمقارنة)
+# =========================
+AMOUNT_RE = re.compile(r"(?:مبلغ|المبلغ|amount)\s*[:：]?\s*(\d{3,})", re.IGNORECASE)
+
+
+def split_into_orders(text):
+    """كل طلب يبدأ برقم هاتف (07... أو +9647...)، فنقسم حسب ظهور أرقام الهواتف."""
+    matches = list(main.PHONE_RE.finditer(text))
+    if not matches:
+        return [text.strip()] if text.strip() else []
+
+    chunks = []
+    for i, m in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        chunk = text[m.start():end].strip()
+        if chunk:
+            chunks.append(chunk)
+    return chunks
+
+
+def extract_order_fields(order_text):
+    """حقول الطلب بـ re.search لكل حقل. نعتبر أول رقم هاتف هو الأساس."""
+    phone_match = main.PHONE_RE.search(order_text)
+    phone = main.normalize_phone(phone_match.group(1)) if phone_match else ""
+
+    amount_match = AMOUNT_RE.search(order_text)
+    amount = int(amount_match.group(1)) if amount_match else None
+
+    def field(labels, first_line=True):
+        m = re.search(r"(?:" + labels + r")\s*[:：]\s*(.+)", order_text)
+        if not m:
+            return ""
+        value = m.group(1).strip()
+        return value.splitlines()[0] if first_line else value
+
+    return main._order_dict(
+        order_text,
+        phone,
+        amount,
+        field("اسم|الاسم"),
+        field("عنوان|العنوان", first_line=False),
+        field("ملاحظات|ملاحظة", first_line=False),
+        field("محافظة|المدينة"),
+        field("منطقة|المنطقه|قضاء"),
+    )
+
+
+def legacy_parse(text):
+    orders = [extract_order_fields(x) for x in split_into_orders(text) if x.strip()]
+    return [o for o in orders if o.get("raw")]
+
+
+def random_phone(rnd):
+    digits = "".join(rnd.choice("0123456789") for _ in range(9))
+    return rnd.choice(["07" + digits, "+9647" + digits, "+964 7" + digits])
+
+
+def random_order(rnd):
+    lines = []
+    label = rnd.choice
+    if rnd.random() < 0.9:
+        lines.append(f"{label(['اسم', 'الاسم'])}: {label(NAMES)}")
+    lines.append(random_phone(rnd))
+    if rnd.random() < 0.8:
+        lines.append(f"{label(['محافظة', 'المدينة'])}: {label(CITIES)}")
+    if rnd.random() < 0.7:
+        lines.append(f"{label(['منطقة', 'المنطقه', 'قضاء'])} : {label(DISTRICTS)}")
+    if rnd.random() < 0.6:
+        lines.append(f"{label(['عنوان', 'العنوان'])}：قرب {label(DISTRICTS)}")
+    if rnd.random() < 0.8:
+        lines.append(f"{label(['مبلغ', 'المبلغ', 'Amount'])} {rnd.randint(5, 200) * 1000}")
+    note = label(NOTES)
+    if note:
+        lines.append(f"{label(['ملاحظات', 'ملاحظة'])}:\n{note}")
+    if rnd.random() < 0.05:
+        # حالات حدّية: تسمية بدون قيمة، أو مبلغ لاصق برقم الهاتف التالي
+        lines.append(label(["اسم:", "مبلغ ", "ملاحظة:  \r"]))
+    rnd.shuffle(lines)
+    return "\n".join(lines)
+
+
+def make_paste(n, seed):
+    rnd = random.Random(seed)
+    parts = ["السلام عليكم هاي الطلبات"] + [random_order(rnd) for _ in range(n)]
+    return rnd.choice(["\n\n", "\n", " "]).join(parts)
+
+
+def measure(fn, text, repeat=3):
+    # التوقيت بدون tracemalloc لأنه يبطئ كل عملية حجز ذاكرة
+    elapsed = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn(text)
+        elapsed = min(elapsed, time.perf_counter() - t0)
+
+    tracemalloc.start()
+    fn(text)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main_bench():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="100,1000,10000,50000")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'orders':>8} {'parser':>10} {'orders/s':>12} {'peak MiB':>10}")
+    for n in (int(x) for x in args.sizes.split(",")):
+        text = make_paste(n, args.seed + n)
+        expected, t_old, m_old = measure(legacy_parse, text)
+        got, t_new, m_new = measure(main.parse_orders, text)
+        if got != expected:
+            raise SystemExit(f"mismatch at {n} orders")
+        for label, t, mem in (("legacy", t_old, m_old), ("tokenize", t_new, m_new)):
+            print(f"{len(got):>8} {label:>10} {len(got) / t:>12,.0f} {mem / 2**20:>10.2f}")
+
+
+if __name__ == "__main__":
+    main_bench()
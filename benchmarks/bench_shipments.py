@@ -0,0 +1,139 @@
+"""
+Benchmark لإنشاء الشحنات (shipments.py) ضد شركة شحن وهمية محلية.
+السيرفر الوهمي يضيف تأخير لكل طلب ويرجع أخطاء عشوائية (503 / 429)، وأحيانًا ينشئ الشحنة
+ثم يرجع 500 (رد ضايع) حتى نتأكد إن إعادة المحاولة بنفس Idempotency-Key ما تكرر الشحنة.
+
+التشغيل:
+    python benchmarks/bench_shipments.py [--orders 500] [--latency 0.05] [--error-rate 0.1]
+"""
+import os
+import sys
+import time
+import random
+import socket
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "bench")
+os.environ.setdefault("WEBHOOK_SECRET", "bench")
+
+import uvicorn  # noqa: E402
+from starlette.applications import Starlette  # noqa: E402
+from starlette.requests import Request  # noqa: E402
+from starlette.responses import JSONResponse, Response  # noqa: E402
+from starlette.routing import Route  # noqa: E402
+
+import main  # noqa: E402
+from bench_parse import make_paste  # noqa: E402
+from shipments import ShipmentPipeline  # noqa: E402
+
+
+class StubCarrier:
+    def __init__(self, latency: float, error_rate: float, seed: int = 1):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rnd = random.Random(seed)
+        self.shipments = {}  # idempotencyKey -> shipment
+        self.requests = 0
+        self.replays = 0
+
+    def _create(self, item):
+        key = item["idempotencyKey"]
+        if key in self.shipments:
+            self.replays += 1
+        else:
+            self.shipments[key] = {"id": len(self.shipments) + 1, "trackingNumber": f"TRK{len(self.shipments) + 1:08d}"}
+        return self.shipments[key]
+
+    async def _handle(self, items):
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        roll = self.rnd.random()
+        if roll < self.error_rate / 3:
+            return Response(status_code=503)
+        if roll < self.error_rate * 2 / 3:
+            return Response(status_code=429, headers={"Retry-After": "0.05"})
+        created = [self._create(i) for i in items]
+        if roll < self.error_rate:
+            return Response(status_code=500)  # انشأت الشحنة بس الرد ضاع
+        return created
+
+    async def single(self, request: Request):
+        result = await self._handle([await request.json()])
+        return result if isinstance(result, Response) else JSONResponse(result[0])
+
+    async def batch(self, request: Request):
+        result = await self._handle(await request.json())
+        return result if isinstance(result, Response) else JSONResponse(result)
+
+    def app(self):
+        return Starlette(
+            routes=[
+                Route("/shipments", self.single, methods=["POST"]),
+                Route("/shipments/batch", self.batch, methods=["POST"]),
+            ]
+        )
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def run_case(orders, args, concurrency, batch_size):
+    carrier = StubCarrier(args.latency, args.error_rate, args.seed)
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(carrier.app(), host="127.0.0.1", port=port, log_level="warning"))
+    serve_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    pipeline = ShipmentPipeline(
+        f"http://127.0.0.1:{port}",
+        concurrency=concurrency,
+        batch_size=batch_size,
+        backoff=0.05,
+        max_retries=6,
+    )
+    edits = 0
+
+    async def progress(done, total, failed):
+        nonlocal edits
+        edits += 1
+
+    t0 = time.perf_counter()
+    results = await pipeline.submit(orders, progress)
+    elapsed = time.perf_counter() - t0
+    await pipeline.aclose()
+    server.should_exit = True
+    await serve_task
+
+    ok = sum(r.ok for r in results)
+    unique = len({main.normalize_phone(o["phone"]) + o["raw"] for o in orders})
+    print(
+        f"{concurrency:>5} {batch_size:>6} {ok / elapsed:>10,.0f} {elapsed:>8.2f} "
+        f"{ok:>6}/{len(orders):<6} {len(carrier.shipments):>8} {unique:>7} "
+        f"{carrier.requests:>8} {carrier.replays:>7} {edits:>6}"
+    )
+
+
+async def main_bench(args):
+    orders = main.parse_orders(make_paste(args.orders, args.seed))
+    print(f"{len(orders)} orders, latency {args.latency * 1000:.0f} ms, error rate {args.error_rate:.0%}")
+    print(f"{'conc':>5} {'batch':>6} {'orders/s':>10} {'secs':>8} {'ok':>13} {'created':>8} {'unique':>7} "
+          f"{'requests':>8} {'replays':>7} {'edits':>6}")
+    cases = [(1, 1), (16, 1), (64, 1), (8, 25)]
+    for concurrency, batch_size in cases:
+        await run_case(orders, args, concurrency, batch_size)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main_bench(parser.parse_args()))
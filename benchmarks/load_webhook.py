@@ -0,0 +1,158 @@
+"""
+Load test محلي لوضع الـ webhook.
+يشغل main.create_app على uvicorn محلي مع Bot API وهمي (بتأخير ثابت لكل طلب)
+ويرسل تحديثات مصطنعة عبر POST، ثم يطبع التحديثات بالثانية وزمن المعالجة p50/p99.
+زمن المعالجة = من الـ POST لحد ما يخلص handler التحديث، لأن إشعارات الاستلام صارت
+مجمعة (رد واحد يتعدل) وما نقدر نطابق كل رد بتحديث.
+
+التشغيل:
+    python benchmarks/load_webhook.py [--updates 2000] [--chats 200] [--concurrent-updates 256] [--api-latency 0.05]
+
+عميل httpx نفسه يصير عنق زجاجة مع اتصالات كثيرة، لذلك الافتراضي 5 اتصالات.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "123456:bench")
+os.environ.setdefault("WEBHOOK_SECRET", "bench")
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+from telegram import Update  # noqa: E402
+from telegram.ext import Application, TypeHandler  # noqa: E402
+from telegram.request import BaseRequest  # noqa: E402
+
+import main  # noqa: E402
+
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+
+
+class FakeBotAPI(BaseRequest):
+    """Bot API وهمي: يرد على getMe و sendMessage ويسجل وقت كل رد."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        self.calls += 1
+        endpoint = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        if endpoint == "getMe":
+            result = BOT_USER
+        else:
+            await asyncio.sleep(self.latency)
+            chat_id = int(params.get("chat_id", 0))
+            result = {
+                "message_id": self.calls,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": params.get("text", ""),
+            }
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+def make_update(update_id: int, chat_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "تاجر"},
+            "text": f"اسم: زبون {update_id}\n0770{update_id:07d}\nمبلغ 25000",
+        },
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def run(args):
+    api = FakeBotAPI(args.api_latency)
+    application = (
+        Application.builder()
+        .token(os.environ["BOT_TOKEN"])
+        .updater(None)
+        .concurrent_updates(args.concurrent_updates)
+        .request(api)
+        .build()
+    )
+    main.add_handlers(application)
+
+    handled = {}
+
+    async def mark_done(update, context):
+        handled[update.update_id] = time.perf_counter()
+
+    # group=1 يتنفذ بعد ما يخلص handler الرسالة بالـ group 0
+    application.add_handler(TypeHandler(Update, mark_done), group=1)
+
+    port = free_port()
+    server = uvicorn.Server(
+        uvicorn.Config(main.create_app(application), host="127.0.0.1", port=port, log_level="warning")
+    )
+    serve_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    url = f"http://127.0.0.1:{port}{main.WEBHOOK_PATH}"
+    headers = {"X-Telegram-Bot-Api-Secret-Token": main.WEBHOOK_SECRET}
+    posted = {}
+    limit = asyncio.Semaphore(args.connections)
+
+    async with httpx.AsyncClient(limits=httpx.Limits(max_connections=args.connections)) as client:
+
+        async def post(update_id):
+            chat_id = 1000 + update_id % args.chats
+            async with limit:
+                posted[update_id] = time.perf_counter()
+                r = await client.post(url, json=make_update(update_id, chat_id), headers=headers)
+                r.raise_for_status()
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(post(i) for i in range(1, args.updates + 1)))
+        while len(handled) < args.updates:
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - t0
+
+    server.should_exit = True
+    await serve_task
+
+    latencies = [handled[u] - sent for u, sent in posted.items()]
+    print(f"updates:            {args.updates}")
+    print(f"concurrent updates: {args.concurrent_updates}")
+    print(f"updates/sec:        {args.updates / elapsed:,.0f}")
+    print(f"p50 latency (ms):   {percentile(latencies, 0.50) * 1000:.1f}")
+    print(f"p99 latency (ms):   {percentile(latencies, 0.99) * 1000:.1f}")
+    print(f"Bot API calls:      {api.calls}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--connections", type=int, default=5)
+    parser.add_argument("--concurrent-updates", type=int, default=main.CONCURRENT_UPDATES)
+    parser.add_argument("--api-latency", type=float, default=0.05)
+    asyncio.run(run(parser.parse_args()))
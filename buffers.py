@@ -0,0 +1,360 @@
+import abc
+import time
+import sqlite3
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+
+class BufferFullError(Exception):
+    """الرسالة تتجاوز الحد الأقصى لحجم التجميع في هذه المحادثة."""
+
+
+class BufferStats(NamedTuple):
+    chats: int
+    messages: int
+    bytes: int
+    max_chat_bytes: int  # أكبر تجميع بمحادثة وحدة
+
+
+class BufferStore(abc.ABC):
+    """
+    مخزن رسائل التجميع لكل محادثة.
+    الإضافة append-only، و take تقرأ وتمسح بخطوة وحدة حتى ما يتعالج نفس التجميع مرتين.
+    """
+
+    def __init__(self, max_bytes: int, idle_ttl: float):
+        self.max_bytes = max_bytes  # 0 = بدون حد
+        self.idle_ttl = idle_ttl  # 0 = بدون انتهاء
+        self._last_eviction = 0.0
+
+    @abc.abstractmethod
+    async def append(self, chat_id: int, text: str) -> int:
+        """يضيف رسالة ويرجع عدد الرسائل بالتجميع. يرمي BufferFullError إذا تجاوز الحد."""
+
+    @abc.abstractmethod
+    async def take(self, chat_id: int) -> List[str]:
+        """يرجع رسائل المحادثة ويمسحها."""
+
+    @abc.abstractmethod
+    async def take_if_idle(self, chat_id: int, idle: float) -> Optional[List[str]]:
+        """
+        مثل take بس إذا آخر رسالة وصلت قبل idle ثانية على الأقل، وإلا يرجع None بدون ما يمسح.
+        موعد المعالجة التلقائية محفوظ بكل عملية، فهذا الفحص يشمل رسائل وصلت لعملية ثانية.
+        """
+
+    @abc.abstractmethod
+    async def restore(self, chat_id: int, messages: List[str]):
+        """يرجع رسائل انسحبت بـ take قبل أي رسالة وصلت بعدها (إذا فشل تسليم النتيجة)."""
+
+    @abc.abstractmethod
+    async def clear(self, chat_id: int):
+        """يمسح رسائل المحادثة بدون ما يرجعها."""
+
+    @abc.abstractmethod
+    async def evict_idle(self) -> int:
+        """يمسح التجميعات اللي ما وصلها شي من فترة idle_ttl ويرجع عددها."""
+
+    @abc.abstractmethod
+    async def stats(self) -> BufferStats:
+        """أرقام مجمعة لكل التجميعات (للمراقبة)."""
+
+    @abc.abstractmethod
+    async def get_setting(self, chat_id: int, key: str) -> Optional[str]:
+        """إعداد محفوظ للمحادثة (مثل شكل النتيجة). ما ينمسح مع take أو evict_idle."""
+
+    @abc.abstractmethod
+    async def set_setting(self, chat_id: int, key: str, value: str):
+        pass
+
+    async def close(self):
+        pass
+
+    def _eviction_due(self, now: float) -> bool:
+        # نفحص التجميعات المهملة مرة كل دقيقة كحد أقصى، مو مع كل رسالة
+        if not self.idle_ttl or now - self._last_eviction < min(self.idle_ttl, 60):
+            return False
+        self._last_eviction = now
+        return True
+
+
+class _ChatBuffer:
+    __slots__ = ("messages", "bytes", "updated_at")
+
+    def __init__(self):
+        self.messages: List[str] = []
+        self.bytes = 0
+        self.updated_at = 0.0
+
+
+class MemoryBufferStore(BufferStore):
+    """مخزن بالذاكرة لعملية وحدة. يضيع عند إعادة التشغيل."""
+
+    def __init__(self, max_bytes: int = 0, idle_ttl: float = 0):
+        super().__init__(max_bytes, idle_ttl)
+        self._chats: Dict[int, _ChatBuffer] = {}
+        self._settings: Dict[Tuple[int, str], str] = {}
+
+    async def append(self, chat_id: int, text: str) -> int:
+        now = time.time()
+        if self._eviction_due(now):
+            await self.evict_idle()
+
+        size = len(text.encode("utf-8"))
+        buf = self._chats.get(chat_id)
+        current = buf.bytes if buf is not None else 0
+        # نفحص الحد قبل الإنشاء حتى رسالة أولى مرفوضة ما تترك تجميع فارغ
+        if self.max_bytes and current + size > self.max_bytes:
+            raise BufferFullError(chat_id)
+        if buf is None:
+            buf = self._chats[chat_id] = _ChatBuffer()
+
+        buf.messages.append(text)
+        buf.bytes += size
+        buf.updated_at = now
+        return len(buf.messages)
+
+    async def take(self, chat_id: int) -> List[str]:
+        buf = self._chats.pop(chat_id, None)
+        return buf.messages if buf else []
+
+    async def take_if_idle(self, chat_id: int, idle: float) -> Optional[List[str]]:
+        buf = self._chats.get(chat_id)
+        if buf is not None and buf.updated_at > time.time() - idle:
+            return None
+        return await self.take(chat_id)
+
+    async def restore(self, chat_id: int, messages: List[str]):
+        buf = self._chats.get(chat_id)
+        if buf is None:
+            buf = self._chats[chat_id] = _ChatBuffer()
+            buf.updated_at = time.time()
+        buf.messages[:0] = messages
+        buf.bytes += sum(len(m.encode("utf-8")) for m in messages)
+
+    async def clear(self, chat_id: int):
+        self._chats.pop(chat_id, None)
+
+    async def evict_idle(self) -> int:
+        if not self.idle_ttl:
+            return 0
+        cutoff = time.time() - self.idle_ttl
+        stale = [chat_id for chat_id, buf in self._chats.items() if buf.updated_at < cutoff]
+        for chat_id in stale:
+            del self._chats[chat_id]
+        return len(stale)
+
+    async def stats(self) -> BufferStats:
+        buffers = list(self._chats.values())
+        return BufferStats(
+            chats=len(buffers),
+            messages=sum(len(b.messages) for b in buffers),
+            bytes=sum(b.bytes for b in buffers),
+            max_chat_bytes=max((b.bytes for b in buffers), default=0),
+        )
+
+    async def get_setting(self, chat_id: int, key: str) -> Optional[str]:
+        return self._settings.get((chat_id, key))
+
+    async def set_setting(self, chat_id: int, key: str, value: str):
+        self._settings[(chat_id, key)] = value
+
+
+class SQLiteBufferStore(BufferStore):
+    """
+    مخزن SQLite بوضع WAL، يتشارك بين أكثر من worker على نفس الملف.
+    كل رسالة صف جديد، والقراءة+المسح داخل BEGIN IMMEDIATE حتى يأخذ التجميع worker واحد بس.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS buffer_messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_id INTEGER NOT NULL,
+        text TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS buffer_messages_chat ON buffer_messages (chat_id, id);
+    CREATE TABLE IF NOT EXISTS buffer_chats (
+        chat_id INTEGER PRIMARY KEY,
+        bytes INTEGER NOT NULL,
+        messages INTEGER NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS buffer_chats_updated ON buffer_chats (updated_at);
+    CREATE TABLE IF NOT EXISTS chat_settings (
+        chat_id INTEGER NOT NULL,
+        key TEXT NOT NULL,
+        value TEXT NOT NULL,
+        PRIMARY KEY (chat_id, key)
+    );
+    """
+
+    def __init__(self, path: str, max_bytes: int = 0, idle_ttl: float = 0):
+        super().__init__(max_bytes, idle_ttl)
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        # ثريد واحد يملك الاتصال، فكل العمليات على الملف تمشي بالترتيب
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="buffers")
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(self.SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _append(self, chat_id: int, text: str, now: float) -> int:
+        db = self._db()
+        size = len(text.encode("utf-8"))
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute(
+                "SELECT bytes, messages FROM buffer_chats WHERE chat_id = ?", (chat_id,)
+            ).fetchone()
+            current, count = row if row else (0, 0)
+            if self.max_bytes and current + size > self.max_bytes:
+                raise BufferFullError(chat_id)
+
+            db.execute("INSERT INTO buffer_messages (chat_id, text) VALUES (?, ?)", (chat_id, text))
+            db.execute(
+                "INSERT INTO buffer_chats (chat_id, bytes, messages, updated_at) VALUES (?, ?, 1, ?) "
+                "ON CONFLICT (chat_id) DO UPDATE SET "
+                "bytes = bytes + excluded.bytes, messages = messages + 1, updated_at = excluded.updated_at",
+                (chat_id, size, now),
+            )
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+        return count + 1
+
+    def _take(self, chat_id: int, cutoff: Optional[float] = None) -> Optional[List[str]]:
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            if cutoff is not None:
+                row = db.execute("SELECT updated_at FROM buffer_chats WHERE chat_id = ?", (chat_id,)).fetchone()
+                if row is not None and row[0] > cutoff:
+                    db.execute("ROLLBACK")
+                    return None
+            rows = db.execute(
+                "SELECT text FROM buffer_messages WHERE chat_id = ? ORDER BY id", (chat_id,)
+            ).fetchall()
+            db.execute("DELETE FROM buffer_messages WHERE chat_id = ?", (chat_id,))
+            db.execute("DELETE FROM buffer_chats WHERE chat_id = ?", (chat_id,))
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+        return [r[0] for r in rows]
+
+    def _restore(self, chat_id: int, messages: List[str], now: float):
+        db = self._db()
+        size = sum(len(m.encode("utf-8")) for m in messages)
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            # ids أصغر من كل الموجود حتى ترجع قبل أي رسالة وصلت بعد take
+            (lowest,) = db.execute("SELECT MIN(id) FROM buffer_messages").fetchone()
+            first = (lowest if lowest is not None else 1) - len(messages)
+            db.executemany(
+                "INSERT INTO buffer_messages (id, chat_id, text) VALUES (?, ?, ?)",
+                ((first + i, chat_id, text) for i, text in enumerate(messages)),
+            )
+            db.execute(
+                "INSERT INTO buffer_chats (chat_id, bytes, messages, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (chat_id) DO UPDATE SET "
+                "bytes = bytes + excluded.bytes, messages = messages + excluded.messages",
+                (chat_id, size, len(messages), now),
+            )
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def _evict(self, cutoff: float) -> int:
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            stale = [
+                r[0]
+                for r in db.execute("SELECT chat_id FROM buffer_chats WHERE updated_at < ?", (cutoff,))
+            ]
+            db.executemany("DELETE FROM buffer_messages WHERE chat_id = ?", ((c,) for c in stale))
+            db.executemany("DELETE FROM buffer_chats WHERE chat_id = ?", ((c,) for c in stale))
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+        return len(stale)
+
+    def _stats(self) -> BufferStats:
+        row = self._db().execute(
+            "SELECT COUNT(*), TOTAL(messages), TOTAL(bytes), MAX(bytes) FROM buffer_chats"
+        ).fetchone()
+        return BufferStats(row[0], int(row[1]), int(row[2]), row[3] or 0)
+
+    def _get_setting(self, chat_id: int, key: str) -> Optional[str]:
+        row = self._db().execute(
+            "SELECT value FROM chat_settings WHERE chat_id = ? AND key = ?", (chat_id, key)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _set_setting(self, chat_id: int, key: str, value: str):
+        self._db().execute(
+            "INSERT INTO chat_settings (chat_id, key, value) VALUES (?, ?, ?) "
+            "ON CONFLICT (chat_id, key) DO UPDATE SET value = excluded.value",
+            (chat_id, key, value),
+        )
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def append(self, chat_id: int, text: str) -> int:
+        now = time.time()
+        if self._eviction_due(now):
+            await self.evict_idle()
+        return await self._run(self._append, chat_id, text, now)
+
+    async def take(self, chat_id: int) -> List[str]:
+        return await self._run(self._take, chat_id)
+
+    async def take_if_idle(self, chat_id: int, idle: float) -> Optional[List[str]]:
+        return await self._run(self._take, chat_id, time.time() - idle)
+
+    async def restore(self, chat_id: int, messages: List[str]):
+        await self._run(self._restore, chat_id, messages, time.time())
+
+    async def clear(self, chat_id: int):
+        await self._run(self._take, chat_id)
+
+    async def evict_idle(self) -> int:
+        if not self.idle_ttl:
+            return 0
+        return await self._run(self._evict, time.time() - self.idle_ttl)
+
+    async def stats(self) -> BufferStats:
+        return await self._run(self._stats)
+
+    async def get_setting(self, chat_id: int, key: str) -> Optional[str]:
+        return await self._run(self._get_setting, chat_id, key)
+
+    async def set_setting(self, chat_id: int, key: str, value: str):
+        await self._run(self._set_setting, chat_id, key, value)
+
+    async def close(self):
+        await self._run(self._close)
+        self._executor.shutdown(wait=True)
+
+
+def create_buffer_store(backend: str, path: str, max_bytes: int, idle_ttl: float) -> BufferStore:
+    if backend == "memory":
+        return MemoryBufferStore(max_bytes, idle_ttl)
+    if backend == "sqlite":
+        return SQLiteBufferStore(path, max_bytes, idle_ttl)
+    raise RuntimeError(f"Unknown BUFFER_BACKEND: {backend}")
@@ -0,0 +1,166 @@
+import io
+import csv
+import json
+from typing import Dict, List, Optional
+
+from telegram import Bot, InputFile
+
+# حد تيليجرام للرسالة الوحدة (يحسبها بوحدات UTF-16) وللـ caption
+TELEGRAM_MAX_MESSAGE = 4096
+TELEGRAM_MAX_CAPTION = 1024
+
+OUTPUT_MODES = ("auto", "chunks", "summary", "json", "jsonl", "csv")
+DOCUMENT_FORMATS = ("json", "jsonl", "csv")
+
+CSV_FIELDS = ("customerName", "phone", "amountIQD", "city", "district", "address", "notes", "raw")
+
+CODE_OPEN = "```json\n"
+CODE_CLOSE = "\n```"
+
+
+def tg_len(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _hard_split(line: str, budget: int) -> List[str]:
+    """تقطيع سطر أطول من الحد على مستوى الحروف."""
+    pieces, current, size = [], [], 0
+    for ch in line:
+        n = 2 if ord(ch) > 0xFFFF else 1
+        if size + n > budget:
+            pieces.append("".join(current))
+            current, size = [], 0
+        current.append(ch)
+        size += n
+    if current:
+        pieces.append("".join(current))
+    return pieces
+
+
+def pack_lines(lines: List[str], budget: int, first_budget: Optional[int] = None) -> List[str]:
+    """
+    تجميع الأسطر برسائل كل وحدة ضمن الحد، بدون قطع سطر إلا إذا هو لوحده أطول من الحد.
+    first_budget للرسالة الأولى لأن بيها العنوان.
+    """
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    limit = first_budget if first_budget is not None else budget
+
+    for line in lines:
+        n = tg_len(line)
+        pieces = [line] if n <= limit else _hard_split(line, limit)
+        for piece in pieces:
+            n = tg_len(piece)
+            extra = n + (1 if current else 0)  # +1 للسطر الجديد
+            if current and size + extra > limit:
+                chunks.append("\n".join(current))
+                current, size, limit = [], 0, budget
+                extra = n
+            current.append(piece)
+            size += extra
+
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def order_lines(orders: List[Dict]) -> List[str]:
+    """سطر JSON مضغوط لكل طلب (نفس أسطر ملف JSONL)."""
+    return [json.dumps(o, ensure_ascii=False, separators=(",", ":")) for o in orders]
+
+
+def render_chunks(header: str, lines: List[str], limit: int = TELEGRAM_MAX_MESSAGE) -> List[str]:
+    """رسائل Markdown، كل وحدة بيها code block مكتمل حتى ما ينكسر التنسيق بين الرسائل."""
+    # ما نقدر نهرب ` داخل code block بـ Markdown، فنبدله بحرف شبيه
+    safe = [line.replace("`", "ˋ") for line in lines]
+    overhead = tg_len(CODE_OPEN + CODE_CLOSE)
+    first = limit - overhead - tg_len(header) - 2
+    bodies = pack_lines(safe, limit - overhead, first)
+    chunks = [f"{CODE_OPEN}{body}{CODE_CLOSE}" for body in bodies]
+    if chunks:
+        chunks[0] = f"{header}\n\n{chunks[0]}"
+    return chunks or [header]
+
+
+def summary_line(index: int, order: Dict) -> str:
+    parts = [order["customerName"], order["phone"], f"{order['amountIQD']:,} IQD"]
+    place = " ".join(x for x in (order["city"], order["district"]) if x)
+    if place:
+        parts.append(place)
+    return f"{index}. " + " | ".join(parts)
+
+
+def render_summary(header: str, orders: List[Dict], limit: int = TELEGRAM_MAX_MESSAGE) -> List[str]:
+    """سطر مختصر لكل طلب، نص عادي بدون parse_mode."""
+    lines = [summary_line(i, o) for i, o in enumerate(orders, 1)]
+    return pack_lines([header, ""] + lines, limit)
+
+
+def render_document(orders: List[Dict], fmt: str, lines: Optional[List[str]] = None) -> bytes:
+    """بناء ملف النتائج بالذاكرة (بدون ملفات مؤقتة)."""
+    if fmt == "csv":
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=CSV_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(orders)
+        # BOM حتى يفتح Excel الحروف العربية صح
+        return buf.getvalue().encode("utf-8-sig")
+
+    lines = lines if lines is not None else order_lines(orders)
+    if fmt == "jsonl":
+        return ("\n".join(lines) + "\n").encode("utf-8") if lines else b""
+    if fmt == "json":
+        return ("[" + ",\n".join(lines) + "]").encode("utf-8")
+    raise ValueError(f"Unknown document format: {fmt}")
+
+
+def pick_mode(header: str, lines: List[str], max_chunks: int) -> str:
+    """وضع auto: رسائل إذا النتيجة تنرسل بـ max_chunks رسائل أو أقل، وإلا ملف JSON."""
+    budget = max_chunks * (TELEGRAM_MAX_MESSAGE - tg_len(CODE_OPEN + CODE_CLOSE)) - tg_len(header)
+    total = 0
+    for line in lines:
+        total += tg_len(line) + 1
+        if total > budget:
+            return "json"
+    return "chunks"
+
+
+async def send_orders(
+    bot: Bot,
+    chat_id: int,
+    header: str,
+    orders: List[Dict],
+    mode: str = "auto",
+    max_chunks: int = 3,
+):
+    """
+    إرسال نتيجة التحليل حسب الوضع: chunks / summary / json / jsonl / csv / auto.
+    الرسائل ما تتجاوز max_chunks بأي وضع: إذا النتيجة أكبر تنرسل ملف بدلها
+    (json بدل chunks، و csv بدل summary)، حتى /done ما يعلق بحد الإرسال لكل محادثة.
+    """
+    lines = order_lines(orders) if mode in ("auto", "chunks", "json", "jsonl") else None
+    if mode == "auto":
+        mode = pick_mode(header, lines, max_chunks)
+
+    chunks: List[str] = []
+    parse_mode = None
+    if mode == "summary":
+        chunks = render_summary(header, orders)
+    elif mode == "chunks":
+        chunks, parse_mode = render_chunks(header, lines), "Markdown"
+    if len(chunks) > max_chunks:
+        mode = "csv" if mode == "summary" else "json"
+
+    if mode in DOCUMENT_FORMATS:
+        data = render_document(orders, mode, lines)
+        caption = header if tg_len(header) <= TELEGRAM_MAX_CAPTION else None
+        await bot.send_document(
+            chat_id=chat_id,
+            document=InputFile(data, filename=f"orders.{mode}"),
+            caption=caption,
+        )
+        return
+
+    for text in chunks:
+        await bot.send_message(chat_id=chat_id, text=text, parse_mode=parse_mode)
@@ -0,0 +1,144 @@
+import re
+import json
+from typing import Dict, List, NamedTuple, Tuple
+
+# توحيد الإملاء قبل المطابقة (للأسماء وللنص): ة/ه، ى/ي، الهمزات، التشكيل والتطويل،
+# والحروف الفارسية/الكردية اللي تطلع من كيبورد كردي.
+# سلسلة replace أسرع بكثير من str.translate على النص العربي (translate تمر حرف حرف على dict).
+_REPLACEMENTS = (
+    ("أ", "ا"),
+    ("إ", "ا"),
+    ("آ", "ا"),
+    ("ٱ", "ا"),
+    ("ة", "ه"),
+    ("ى", "ي"),
+    ("ی", "ي"),
+    ("ک", "ك"),
+    ("ە", "ه"),
+)
+_MARKS_RE = re.compile("[\u064B-\u0652\u0670\u0640]")
+
+# كلمة = حروف عربية أو لاتينية بعد التوحيد. الأرقام والرموز فواصل.
+# مجموعة صريحة أسرع من \w اللي يفحص تصنيف Unicode لكل حرف.
+WORD_RE = re.compile("[ء-يٮ-ۓەa-z]+")
+
+# حروف تلتصق ببداية الكلمة: "ببغداد"، "والكرادة"، "للبصرة"
+PROCLITICS = "وبل"
+
+# "الزبير" تنطابق مع "زبير" بس الأسماء القصيرة بدون ال تصير كلمات عامة ("كوت"، "خالص")
+MIN_BARE_LENGTH = 5
+
+_END = ""  # مفتاح نهاية العبارة بعقدة الـ trie (ما يتطابق مع أي كلمة)
+
+
+def normalize(text: str) -> str:
+    text = _MARKS_RE.sub("", text)
+    for old, new in _REPLACEMENTS:
+        text = text.replace(old, new)
+    return text.casefold()
+
+
+class Place(NamedTuple):
+    governorate: str
+    district: str  # فارغ = المحافظة نفسها
+
+
+class Gazetteer:
+    """
+    دليل المحافظات والأقضية مبني كـ trie على مستوى الكلمات.
+    الفحص يمشي على كلمات النص مرة وحدة، وكل خطوة lookup بـ dict، فالكلفة تعتمد على طول
+    النص وأطول اسم (بالكلمات) وما تكبر مع عدد الأسماء بالدليل.
+    """
+
+    def __init__(self, data: Dict[str, Dict]):
+        self._root: Dict = {}
+        self.size = 0  # عدد الصيغ المبنية
+        for governorate, info in data.items():
+            for name in [governorate, *info.get("aliases", [])]:
+                self._add(name, Place(governorate, ""))
+            for district, aliases in info.get("districts", {}).items():
+                for name in [district, *aliases]:
+                    self._add(name, Place(governorate, district))
+        # بعد كل الأسماء حتى ما تغطي صيغة ملتصقة على اسم حقيقي؛ نفس العقدة فتتشارك الفروع
+        for first, node in list(self._root.items()):
+            for prefixed in self._prefixed(first):
+                self._root.setdefault(prefixed, node)
+
+    @classmethod
+    def from_file(cls, path: str) -> "Gazetteer":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    @staticmethod
+    def variants(name: str) -> List[str]:
+        """الاسم موحد الإملاء، وبدون ال إذا الباقي طويل كفاية."""
+        base = " ".join(WORD_RE.findall(normalize(name)))
+        forms = [base]
+        if base.startswith("ال") and len(base) - 2 >= MIN_BARE_LENGTH:
+            forms.append(base[2:])
+        return forms
+
+    @staticmethod
+    def _prefixed(word: str) -> List[str]:
+        """أول كلمة مع الحروف الملتصقة بيها، تنضاف للـ trie وقت البناء حتى الفحص يبقى lookup واحد."""
+        forms = [p + word for p in PROCLITICS]
+        if word.startswith("ال"):
+            forms.append("لل" + word[2:])  # "للبصرة" = ل + البصرة بعد ما تنحذف ألف ال
+        return forms
+
+    def _add(self, name: str, place: Place):
+        for form in self.variants(name):
+            node = self._root
+            for word in form.split():
+                node = node.setdefault(word, {})
+            places = node.setdefault(_END, [])
+            if place not in places:
+                places.append(place)
+                self.size += 1
+
+    def scan(self, text: str) -> List[List[Place]]:
+        """كل الأماكن المذكورة بالترتيب. عند التداخل ناخذ أطول اسم ("بغداد الجديدة" مو "بغداد")."""
+        words = WORD_RE.findall(normalize(text))
+        found: List[List[Place]] = []
+        i = 0
+        while i < len(words):
+            node = self._root.get(words[i])
+            match, end = None, i
+            j = i
+            while node is not None:
+                if _END in node:
+                    match, end = node[_END], j
+                j += 1
+                node = node.get(words[j]) if j < len(words) else None
+            if match is None:
+                i += 1
+                continue
+            found.append(match)
+            i = end + 1
+        return found
+
+    def _governorate(self, city: str) -> str:
+        """المحافظة المقصودة بقيمة تسمية "محافظة:" (اسم محافظة أو مدينة بيها)."""
+        for places in self.scan(city):
+            return places[0].governorate
+        return ""
+
+    def locate(self, text: str, city: str = "") -> Tuple[str, str]:
+        """
+        (المحافظة، القضاء) بالأسماء الرسمية من الدليل، أو "" إذا ما انذكرت.
+        city قيمة تسمية موجودة: القضاء لازم يكون من نفس المحافظة.
+        """
+        found = self.scan(text)
+        governorate = self._governorate(city) if city else ""
+        if not governorate:
+            governorate = next((p.governorate for ps in found for p in ps if not p.district), "")
+        district = ""
+        for places in found:
+            place = next(
+                (p for p in places if p.district and (not governorate or p.governorate == governorate)), None
+            )
+            if place is not None:
+                district = place.district
+                governorate = governorate or place.governorate
+                break
+        return governorate, district
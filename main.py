@@ -1,10 +1,20 @@
 import os
 import re
-import json
 import asyncio
+import hmac
+import time
+import hashlib
+import logging
+import functools
+from contextlib import asynccontextmanager
 from typing import Dict, List, Optional
 
-from telegram import Update
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+from telegram import Bot, Update
+from telegram.error import BadRequest, TelegramError
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -13,24 +23,154 @@ from telegram.ext import (
     filters,
 )
 
+from buffers import BufferFullError, create_buffer_store
+from delivery import OUTPUT_MODES, send_orders
+from gazetteer import Gazetteer
+from metrics import COUNT_BUCKETS, Registry
+from outbound import PRIORITY_STATUS, AckCoalescer, OutboundQueue
+from profiling import SlowCallProfiler
+from scheduler import DebounceScheduler
+from shipments import ShipmentPipeline, ShipmentResult
+
+logger = logging.getLogger(__name__)
+
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 if not BOT_TOKEN:
     raise RuntimeError("Missing BOT_TOKEN env var")
 
 # =========================
-# In-memory buffers per user/chat
+# Buffers per user/chat
 # =========================
-BUFFERS: Dict[int, List[str]] = {}
-TIMERS: Dict[int, asyncio.Task] = {}
+# memory: عملية وحدة فقط. sqlite: يبقى بعد إعادة التشغيل ويتشارك بين workers.
+# التحليل التدريجي محلي بكل worker، فمع sqlite وعدة workers رسائل المحادثة تتوزع عليهم
+# و /done يحلل النص كامل غالبًا (بـ thread، مو على الـ event loop).
+BUFFER_BACKEND = os.getenv("BUFFER_BACKEND", "memory")
+BUFFER_DB_PATH = os.getenv("BUFFER_DB_PATH", "buffers.db")
+BUFFER_MAX_BYTES = int(os.getenv("BUFFER_MAX_BYTES", str(2 * 1024 * 1024)))  # لكل محادثة، 0 = بدون حد
+BUFFER_IDLE_TTL = int(os.getenv("BUFFER_IDLE_TTL", str(24 * 3600)))  # ثواني، 0 = بدون انتهاء
+
+BUFFER_STORE = create_buffer_store(BUFFER_BACKEND, BUFFER_DB_PATH, BUFFER_MAX_BYTES, BUFFER_IDLE_TTL)
+STREAMS: Dict[int, "OrderStream"] = {}  # تحليل تدريجي محلي، المرجع دائمًا BUFFER_STORE
 
 AUTO_PROCESS_SECONDS = int(os.getenv("AUTO_PROCESS_SECONDS", "0"))  # 0 = off
+AUTO_PROCESS_WORKERS = int(os.getenv("AUTO_PROCESS_WORKERS", "8"))  # معالجات تلقائية بنفس الوقت
+
+# =========================
+# Output
+# =========================
+# auto: رسائل إذا النتيجة صغيرة وإلا ملف. التاجر يقدر يغيره بـ /format
+OUTPUT_MODE = os.getenv("OUTPUT_MODE", "auto")
+OUTPUT_MAX_CHUNKS = int(os.getenv("OUTPUT_MAX_CHUNKS", "3"))  # لكل الأوضاع، الأكبر ينرسل ملف
+OUTPUT_SETTING = "output_mode"  # اختيار /format محفوظ بـ BUFFER_STORE مع التجميعات
+
+if OUTPUT_MODE not in OUTPUT_MODES:
+    raise RuntimeError(f"Unknown OUTPUT_MODE: {OUTPUT_MODE}")
+
+# كل الإرسال لتيليجرام يمر من طابور واحد بحدود البوت والمحادثة
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))  # رسالة/ثانية للبوت كله
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))  # رسالة/ثانية لكل محادثة
+
+OUTBOUND = OutboundQueue(global_rate=OUTBOUND_GLOBAL_RATE, chat_rate=OUTBOUND_CHAT_RATE)
+
+
+def _ack_text(messages: int, orders: Optional[int], full: bool) -> str:
+    lines = [f"📥 تم استلام {messages} رسالة."] if messages else []
+    if orders is not None:
+        lines.append(f"الطلبات لحد الآن: {orders}")
+    if full:
+        lines.append("⚠️ التجميع وصل الحد الأقصى. اكتب /done لمعالجة الموجود ثم أكمل.")
+    else:
+        lines.append("أكمل إرسال البقية ثم /done")
+    return "\n".join(lines)
+
+
+ACKS = AckCoalescer(OUTBOUND, _ack_text)
+
+# =========================
+# Shipments (carrier API)
+# =========================
+CARRIER_API_URL = os.getenv("CARRIER_API_URL", "")  # فارغ = بدون إنشاء شحنات
+CARRIER_API_TOKEN = os.getenv("CARRIER_API_TOKEN", "")
+CARRIER_CONCURRENCY = int(os.getenv("CARRIER_CONCURRENCY", "16"))
+CARRIER_BATCH_SIZE = int(os.getenv("CARRIER_BATCH_SIZE", "1"))  # >1 إذا الـ API يدعم /shipments/batch
+CARRIER_MAX_RETRY_AFTER = float(os.getenv("CARRIER_MAX_RETRY_AFTER", "60"))  # أقصى انتظار لـ Retry-After
+
+SHIPMENTS = (
+    ShipmentPipeline(
+        CARRIER_API_URL,
+        CARRIER_API_TOKEN,
+        concurrency=CARRIER_CONCURRENCY,
+        batch_size=CARRIER_BATCH_SIZE,
+        max_retry_after=CARRIER_MAX_RETRY_AFTER,
+    )
+    if CARRIER_API_URL
+    else None
+)
+
+# =========================
+# Webhook / polling
+# =========================
+# python main.py = polling مباشر بدون uvicorn، مهما كان BOT_MODE
+BOT_MODE = "polling" if __name__ == "__main__" else os.getenv("BOT_MODE", "webhook")  # webhook | polling
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")  # الرابط العام للسيرفر
+WEBHOOK_PATH = "/telegram"
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # تيليجرام يرسله بهيدر كل طلب
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "256"))
+
+if BOT_MODE not in ("webhook", "polling"):
+    raise RuntimeError(f"Unknown BOT_MODE: {BOT_MODE}")
+# بدون secret أي أحد يعرف /telegram يقدر يرسل تحديثات مزورة (وينشئ شحنات)
+if BOT_MODE == "webhook" and not WEBHOOK_SECRET:
+    raise RuntimeError("Missing WEBHOOK_SECRET env var (required when BOT_MODE=webhook)")
 
+# =========================
+# Metrics / profiling
+# =========================
+METRICS_PATH = "/metrics"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")  # فارغ = /metrics مفتوح
+PROFILE_DONE_SECONDS = float(os.getenv("PROFILE_DONE_SECONDS", "0"))  # 0 = بدون profiler
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+METRICS = Registry()
+HANDLER_SECONDS = METRICS.histogram("bot_handler_seconds", "Handler latency end to end.", ["handler"])
+PARSE_SECONDS = METRICS.histogram("bot_parse_seconds", "Order parsing time (feed, finish, full).", ["stage"])
+ORDERS_PER_BATCH = METRICS.histogram(
+    "bot_orders_per_batch", "Orders extracted per /done or auto batch.", buckets=COUNT_BUCKETS
+)
+MESSAGES_PER_BATCH = METRICS.histogram(
+    "bot_messages_per_batch", "Messages per /done or auto batch.", buckets=COUNT_BUCKETS
+)
+BUFFER_FULL = METRICS.counter("bot_buffer_full_total", "Messages rejected because the buffer was full.")
+BUFFER_CHATS = METRICS.gauge("bot_buffer_chats", "Chats with a pending buffer.")
+BUFFER_MESSAGES = METRICS.gauge("bot_buffer_messages", "Buffered messages across all chats.")
+BUFFER_BYTES = METRICS.gauge("bot_buffer_bytes", "Buffered bytes across all chats.")
+BUFFER_MAX_CHAT_BYTES = METRICS.gauge("bot_buffer_max_chat_bytes", "Largest buffer of a single chat.")
+STREAMS_ACTIVE = METRICS.gauge("bot_streams_active", "Chats with an incremental parser in memory.")
+AUTO_PENDING = METRICS.gauge("bot_auto_pending", "Chats waiting for auto processing.")
+OUTBOUND_PENDING = METRICS.gauge("bot_outbound_pending", "Bot API calls waiting in the outbound queue.")
+OUTBOUND_SECONDS = METRICS.histogram(
+    "bot_outbound_seconds", "Bot API call duration.", ["method", "outcome"]
+)
+OUTBOUND_WAIT_SECONDS = METRICS.histogram("bot_outbound_wait_seconds", "Time spent in the outbound queue.")
+
+PROFILER = SlowCallProfiler(PROFILE_DONE_SECONDS, PROFILE_DIR) if PROFILE_DONE_SECONDS > 0 else None
+
+
+# =========================
+# Gazetteer (المحافظات والأقضية)
+# =========================
+# يملأ city/district من النص إذا ما كتبها التاجر بتسمية. فارغ = بدون دليل.
+GAZETTEER_PATH = os.getenv(
+    "GAZETTEER_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "gazetteer_iq.json")
+)
+GAZETTEER = Gazetteer.from_file(GAZETTEER_PATH) if GAZETTEER_PATH else None
 
 # =========================
 # Helpers: parsing
 # =========================
 PHONE_RE = re.compile(r"(\+964\s?7\d{9}|07\d{9})")
-AMOUNT_RE = re.compile(r"(?:مبلغ|المبلغ|amount)\s*[:：]?\s*(\d{3,})", re.IGNORECASE)
+# تسمية اسم الزبون لحد نهاية سطر القيمة (نفس قاعدة تسمية الاسم بـ ORDER_TOKEN_RE)
+NAME_SPAN_RE = re.compile(r"(?:اسم|الاسم)\s*[:：]\s*[^\n]*")
 
 def normalize_phone(phone: str) -> str:
     phone = phone.replace(" ", "")
@@ -38,65 +178,23 @@ def normalize_phone(phone: str) -> str:
         return "0" + phone[4:]  # +9647XXXXXXXXX -> 07XXXXXXXXX
     return phone
 
-def split_into_orders(text: str) -> List[str]:
-    """
-    تقسيم النص إلى طلبات.
-    القاعدة: كل طلب لازم يحتوي رقم هاتف (07... أو +9647...).
-    نقسم حسب ظهور أرقام الهواتف.
-    """
-    matches = list(PHONE_RE.finditer(text))
-    if not matches:
-        return [text.strip()] if text.strip() else []
-
-    chunks = []
-    for i, m in enumerate(matches):
-        start = m.start()
-        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
-        chunk = text[start:end].strip()
-        if chunk:
-            chunks.append(chunk)
-    return chunks
-
-def extract_order_fields(order_text: str) -> Dict:
-    """
-    استخراج حقول عامة من النص.
-    نعتبر أول رقم هاتف هو الأساس.
-    """
-    phone_match = PHONE_RE.search(order_text)
-    phone = normalize_phone(phone_match.group(1)) if phone_match else ""
-
-    amount_match = AMOUNT_RE.search(order_text)
-    amount = int(amount_match.group(1)) if amount_match else None
-
-    # اسم الزبون: نحاول التقاطه من "اسم:" أو "الاسم:"
-    name = ""
-    m = re.search(r"(?:اسم|الاسم)\s*[:：]\s*(.+)", order_text)
-    if m:
-        name = m.group(1).strip().splitlines()[0]
-
-    # العنوان
-    address = ""
-    m = re.search(r"(?:عنوان|العنوان)\s*[:：]\s*(.+)", order_text)
-    if m:
-        address = m.group(1).strip()
-
-    # ملاحظات
-    notes = ""
-    m = re.search(r"(?:ملاحظات|ملاحظة)\s*[:：]\s*(.+)", order_text)
-    if m:
-        notes = m.group(1).strip()
-
-    # المحافظة/المنطقة (اختياري)
-    city = ""
-    m = re.search(r"(?:محافظة|المدينة)\s*[:：]\s*(.+)", order_text)
-    if m:
-        city = m.group(1).strip().splitlines()[0]
-
-    district = ""
-    m = re.search(r"(?:منطقة|المنطقه|قضاء)\s*[:：]\s*(.+)", order_text)
-    if m:
-        district = m.group(1).strip().splitlines()[0]
-
+def _order_dict(
+    order_text: str,
+    phone: str,
+    amount: Optional[int],
+    name: str,
+    address: str,
+    notes: str,
+    city: str,
+    district: str,
+) -> Dict:
+    if GAZETTEER is not None and not (city and district):
+        # سطر اسم الزبون يطلع من البحث حتى ما يتطابق اسم مثل "حمزة" مع قضاء.
+        # نشيل التسمية وقيمتها بس، مو كل تكرار للاسم ("علي" داخل "علي الغربي" بالعنوان)
+        text = NAME_SPAN_RE.sub(" ", order_text, count=1) if name else order_text
+        found_city, found_district = GAZETTEER.locate(text, city)
+        city = city or found_city
+        district = district or found_district
     return {
         "customerName": name or "غير محدد",
         "phone": phone or "غير محدد",
@@ -108,82 +206,373 @@ def extract_order_fields(order_text: str) -> Dict:
         "raw": order_text.strip(),
     }
 
+# =========================
+# Single-pass tokenizer
+# =========================
+# نمط واحد للهاتف والمبلغ وتسميات الحقول يمر على النص كله مرة وحدة.
+# كل رقم هاتف يبدأ طلب جديد، فأرقام المبلغ تتوقف عند بداية رقم هاتف.
+# المحلل القديم (تقسيم بالهواتف ثم re.search لكل حقل) صار مرجع بـ benchmarks/bench_parse.py.
+LABEL_FIELDS = {
+    "اسم": "name",
+    "الاسم": "name",
+    "عنوان": "address",
+    "العنوان": "address",
+    "ملاحظات": "notes",
+    "ملاحظة": "notes",
+    "محافظة": "city",
+    "المدينة": "city",
+    "منطقة": "district",
+    "المنطقه": "district",
+    "قضاء": "district",
+}
+
+ORDER_TOKEN_RE = re.compile(
+    r"(?P<phone>\+964\s?7\d{9}|07\d{9})"
+    r"|(?:مبلغ|المبلغ|(?i:amount))\s*[:：]?\s*(?P<amount>(?:(?!07\d{9})\d){3,})"
+    r"|(?P<label>" + "|".join(LABEL_FIELDS) + r")\s*[:：]\s*"
+)
+
+
+def _finish_order(text: str, start: int, end: int, phone: str, amount: Optional[int], labels: Dict[str, int]) -> Dict:
+    values = {"name": "", "address": "", "notes": "", "city": "", "district": ""}
+    for field, value_start in labels.items():
+        # الحقل لازم تكون له قيمة داخل نفس الطلب
+        if value_start >= end:
+            continue
+        eol = text.find("\n", value_start, end)
+        value = text[value_start:end if eol == -1 else eol].strip()
+        values[field] = value if field in ("address", "notes") else value.splitlines()[0]
+
+    return _order_dict(
+        text[start:end],
+        phone,
+        amount,
+        values["name"],
+        values["address"],
+        values["notes"],
+        values["city"],
+        values["district"],
+    )
+
+
 def parse_orders(full_text: str) -> List[Dict]:
-    orders_text = split_into_orders(full_text)
-    orders = [extract_order_fields(x) for x in orders_text if x.strip()]
-    # فلترة الطلبات الفارغة
-    return [o for o in orders if o.get("raw")]
+    """
+    استخراج كل الطلبات وحقولها بمرور واحد من اليسار لليمين.
+    كل طلب يبدأ برقم هاتف؛ نص بدون هاتف يرجع كطلب واحد بدون هاتف.
+    """
+    orders: List[Dict] = []
+    start = 0
+    phone = ""
+    amount: Optional[int] = None
+    labels: Dict[str, int] = {}
+    seen_phone = False
+
+    for m in ORDER_TOKEN_RE.finditer(full_text):
+        kind = m.lastgroup
+        if kind == "label":
+            field = LABEL_FIELDS[m.group(kind)]
+            if field not in labels:
+                labels[field] = m.end()
+        elif kind == "amount":
+            if amount is None:
+                amount = int(m.group(kind))
+        else:
+            # النص قبل أول هاتف ما يعتبر طلب
+            if seen_phone:
+                orders.append(_finish_order(full_text, start, m.start(), phone, amount, labels))
+            seen_phone = True
+            start = m.start()
+            phone = normalize_phone(m.group(kind))
+            amount = None
+            labels = {}
+
+    if seen_phone or full_text.strip():
+        orders.append(_finish_order(full_text, start, len(full_text), phone, amount, labels))
+    return orders
+
+
+# =========================
+# Incremental parsing per chat
+# =========================
+# أطول تطابق لـ PHONE_RE هو "+964 7XXXXXXXXX". أي هاتف يبدأ قبل نهاية النص بهالمسافة
+# ما يتغير إذا انضاف نص بعده، فالطلب اللي قبله صار مكتمل.
+PHONE_MAX_LEN = 15
+
+
+def _digest_update(digest, msg: str):
+    data = msg.encode("utf-8")
+    digest.update(len(data).to_bytes(8, "little"))
+    digest.update(data)
+
+
+def messages_digest(messages: List[str]) -> bytes:
+    digest = hashlib.blake2b(digest_size=16)
+    for msg in messages:
+        _digest_update(digest, msg)
+    return digest.digest()
+
+
+class OrderStream:
+    """
+    تحليل تدريجي لرسائل محادثة وحدة.
+    كل رسالة تنضاف للذيل، والطلبات اللي انغلقت تتحلل فورًا.
+    finish() تحلل الذيل بس، والنتيجة نفس parse_orders على "\n".join(الرسائل).
+    """
+
+    def __init__(self):
+        self.orders: List[Dict] = []
+        self.tail = ""
+        self.messages = 0
+        self.updated_at = time.monotonic()
+        self._digest = hashlib.blake2b(digest_size=16)
+
+    def feed(self, msg: str):
+        self.tail = f"{self.tail}\n{msg}" if self.messages else msg
+        self.messages += 1
+        self.updated_at = time.monotonic()
+        _digest_update(self._digest, msg)
+
+        limit = len(self.tail) - PHONE_MAX_LEN
+        starts = [m.start() for m in PHONE_RE.finditer(self.tail) if m.start() <= limit]
+        if not starts or starts[-1] == 0:
+            return
+
+        # النص قبل أول هاتف ما يعتبر طلب
+        closed = self.tail[starts[0]:starts[-1]]
+        if closed:
+            self.orders.extend(parse_orders(closed))
+        self.tail = self.tail[starts[-1]:]
+
+    def detected(self) -> int:
+        """عدد الطلبات لحد الآن: المكتملة + أرقام الهواتف بالذيل."""
+        return len(self.orders) + sum(1 for _ in PHONE_RE.finditer(self.tail))
+
+    def finish(self) -> List[Dict]:
+        if not self.messages:
+            return []
+        return self.orders + parse_orders(self.tail)
+
+    def matches(self, messages: List[str]) -> bool:
+        """هل شاف هذا التحليل نفس الرسائل بالضبط (ما ضاف worker ثاني شي بالنص)."""
+        return len(messages) == self.messages and messages_digest(messages) == self._digest.digest()
 
 
 # =========================
 # Bot commands
 # =========================
+async def _collect_orders(chat_id: int, messages: List[str]) -> List[Dict]:
+    """
+    نستخدم التحليل التدريجي إذا شاف نفس الرسائل، وإلا (worker ثاني أو إعادة تشغيل)
+    نحلل النص كامل بـ thread حتى ما يوقف الـ event loop على لصقة كبيرة.
+    """
+    stream = STREAMS.pop(chat_id, None)
+    if stream is not None and stream.matches(messages):
+        with PARSE_SECONDS.time("finish"):
+            orders = stream.finish()
+    else:
+        with PARSE_SECONDS.time("full"):
+            orders = await asyncio.to_thread(parse_orders, "\n".join(messages).strip())
+    MESSAGES_PER_BATCH.observe(len(messages))
+    ORDERS_PER_BATCH.observe(len(orders))
+    return orders
+
+def _prune_streams():
+    if not BUFFER_IDLE_TTL:
+        return
+    cutoff = time.monotonic() - BUFFER_IDLE_TTL
+    for chat_id in [c for c, s in STREAMS.items() if s.updated_at < cutoff]:
+        del STREAMS[chat_id]
+    ACKS.prune(BUFFER_IDLE_TTL)
+
+async def _reply(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
+    await OUTBOUND.via(context.bot).send_message(update.effective_chat.id, text=text)
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(
+    await _reply(
+        update,
+        context,
         "✅ وضع التجميع شغال.\n"
         "ارسل كل رسائل الزبائن (رسالة واحدة أو عدة رسائل).\n\n"
         "لما تخلص اكتب: /done\n"
-        "للحذف: /cancel"
+        "للحذف: /cancel\n"
+        "لتغيير شكل النتيجة: /format"
     )
 
+async def _output_mode(chat_id: int) -> str:
+    mode = await BUFFER_STORE.get_setting(chat_id, OUTPUT_SETTING)
+    return mode if mode in OUTPUT_MODES else OUTPUT_MODE
+
+async def set_format(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    chat_id = update.effective_chat.id
+    mode = context.args[0].lower() if context.args else ""
+    if mode not in OUTPUT_MODES:
+        current = await _output_mode(chat_id)
+        await _reply(
+            update,
+            context,
+            f"شكل النتيجة الحالي: {current}\n"
+            f"الخيارات: {' / '.join(OUTPUT_MODES)}\n"
+            "مثال: /format csv"
+        )
+        return
+
+    await BUFFER_STORE.set_setting(chat_id, OUTPUT_SETTING, mode)
+    await _reply(update, context, f"✅ صار شكل النتيجة: {mode}")
+
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
-    BUFFERS.pop(chat_id, None)
-    t = TIMERS.pop(chat_id, None)
-    if t:
-        t.cancel()
-    await update.message.reply_text("🗑️ تم حذف التجميع الحالي. ارسل من جديد ثم /done.")
+    await BUFFER_STORE.clear(chat_id)
+    STREAMS.pop(chat_id, None)
+    AUTO_SCHEDULER.cancel(chat_id)
+    ACKS.reset(chat_id)
+    await _reply(update, context, "🗑️ تم حذف التجميع الحالي. ارسل من جديد ثم /done.")
 
 async def done(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
-    text = "\n".join(BUFFERS.get(chat_id, [])).strip()
-    BUFFERS.pop(chat_id, None)
-
-    t = TIMERS.pop(chat_id, None)
-    if t:
-        t.cancel()
+    AUTO_SCHEDULER.cancel(chat_id)
+    ACKS.reset(chat_id)
+    messages = await BUFFER_STORE.take(chat_id)
 
-    if not text:
-        await update.message.reply_text("ما استلمت نص بعد. ارسل رسائل ثم /done.")
+    if not messages:
+        STREAMS.pop(chat_id, None)
+        await _reply(update, context, "ما استلمت نص بعد. ارسل رسائل ثم /done.")
         return
 
-    orders = parse_orders(text)
-    pretty = json.dumps(orders, ensure_ascii=False, indent=2)
+    orders = await _collect_orders(chat_id, messages)
+    header = f"✅ تم تحليل الرسائل.\nعدد الطلبات المستخرجة: {len(orders)}"
+    await _deliver(context.bot, chat_id, header, messages, orders)
+    await _create_shipments(context.bot, chat_id, orders)
 
-    await update.message.reply_text(
-        f"✅ تم تحليل الرسائل.\n"
-        f"عدد الطلبات المستخرجة: {len(orders)}\n\n"
-        f"```json\n{pretty}\n```",
-        parse_mode="Markdown"
-    )
 
-    # هنا لاحقًا: نربط إنشاء الشحنات عبر API
-    # for order in orders:
-    #     result = await create_shipment_via_api(order)
-    # ثم نرجع رقم الشحنة/الباركود للتاجر
+async def _deliver(bot: Bot, chat_id: int, header: str, messages: List[str], orders: List[Dict]):
+    """
+    إرسال النتيجة بعد take. إذا ما وصلت (خطأ أو إيقاف السيرفر بالنص) نرجع الرسائل للمخزن
+    حتى ما يضيع التجميع، و /done أو المعالجة التلقائية تعيده.
+    """
+    try:
+        await send_orders(
+            OUTBOUND.via(bot),
+            chat_id,
+            header,
+            orders,
+            mode=await _output_mode(chat_id),
+            max_chunks=OUTPUT_MAX_CHUNKS,
+        )
+    except BaseException:
+        await BUFFER_STORE.restore(chat_id, messages)
+        raise
+
+
+async def _create_shipments(bot: Bot, chat_id: int, orders: List[Dict]):
+    """
+    إنشاء الشحنات بالتوازي مع رسالة حالة وحدة تتعدل بدل رسالة لكل طلب.
+    أي خطأ (من شركة الشحن أو تيليجرام) ما يترك الحالة عالقة على "جاري إنشاء الشحنات".
+    الطلبات بدون رقم هاتف (مثل نص بدون هاتف يرجع كطلب واحد) ما تنرسل لشركة الشحن.
+    """
+    if SHIPMENTS is None or not orders:
+        return
+
+    skipped = len(orders)
+    orders = [o for o in orders if PHONE_RE.fullmatch(o["phone"])]
+    skipped -= len(orders)
+    skipped_text = f"⏭️ تم تخطي {skipped} طلب بدون رقم هاتف." if skipped else ""
+    if not orders:
+        await OUTBOUND.via(bot).send_message(chat_id, text=skipped_text)
+        return
+
+    total = len(orders)
+    out = OUTBOUND.via(bot, PRIORITY_STATUS)
+    try:
+        status = await out.send_message(chat_id, text=f"🚚 جاري إنشاء الشحنات: 0/{total}")
+    except TelegramError as e:
+        logger.warning("shipment status message failed for chat %s: %s", chat_id, e)
+        status = None  # نكمل الشحنات بدون تحديثات ونرسل النتيجة برسالة جديدة
+
+    async def progress(done: int, total: int, failed: int):
+        if status is None or done == total:
+            return  # الرسالة الأخيرة بعد ما تخلص كل الشحنات
+        text = f"🚚 جاري إنشاء الشحنات: {done}/{total}"
+        if failed:
+            text += f" (فشل {failed})"
+        try:
+            await out.edit_message_text(text, chat_id=chat_id, message_id=status.message_id)
+        except BadRequest:
+            pass  # نفس النص أو انحذفت الرسالة
+        except TelegramError as e:
+            logger.warning("shipment progress update failed for chat %s: %s", chat_id, e)
+
+    try:
+        results = await SHIPMENTS.submit(orders, progress)
+    except Exception as e:
+        logger.exception("shipment pipeline failed for chat %s", chat_id)
+        results = [ShipmentResult(o, error=f"{type(e).__name__}: {e}") for o in orders]
+    failed = [r for r in results if not r.ok]
+
+    text = f"✅ تم إنشاء {total - len(failed)} شحنة من {total}."
+    if failed:
+        text += f"\n❌ فشل {len(failed)}:\n" + "\n".join(
+            f"{r.order['phone']} — {r.error}" for r in failed[:10]
+        )
+    if skipped_text:
+        text += "\n" + skipped_text
+    final = OUTBOUND.via(bot)
+    if status is not None:
+        try:
+            await final.edit_message_text(text, chat_id=chat_id, message_id=status.message_id)
+            return
+        except TelegramError as e:
+            logger.warning("shipment status edit failed for chat %s: %s", chat_id, e)
+    await final.send_message(chat_id, text=text)
 
 
 async def _auto_finalize(chat_id: int, app: Application):
-    await asyncio.sleep(AUTO_PROCESS_SECONDS)
-    text = "\n".join(BUFFERS.get(chat_id, [])).strip()
-    if not text:
+    # الموعد محسوب من آخر رسالة وصلت لهذي العملية؛ إذا وصلت رسالة أحدث لـ worker ثاني
+    # (نفس مخزن SQLite) نأجل بدل ما نقطع التجميع. الهامش لفرق الساعة بين العمليات.
+    messages = await BUFFER_STORE.take_if_idle(chat_id, AUTO_PROCESS_SECONDS * 0.9)
+    if messages is None:
+        AUTO_SCHEDULER.schedule(chat_id, app)
+        return
+    # take تقرأ وتمسح مرة وحدة، فإذا سبقنا /done أو worker ثاني نرجع فاضي
+    if not messages:
         return
 
-    orders = parse_orders(text)
-    pretty = json.dumps(orders, ensure_ascii=False, indent=2)
+    ACKS.reset(chat_id)
+    orders = await _collect_orders(chat_id, messages)
+    header = f"⏱️ تم المعالجة تلقائيًا بسبب عدم وجود رسائل جديدة.\nعدد الطلبات: {len(orders)}"
+    try:
+        await _deliver(app.bot, chat_id, header, messages, orders)
+    except Exception:
+        # التجميع رجع للمخزن؛ نعيد المحاولة بعد نفس المدة بدل ما يبقى لحد /done أو الانتهاء
+        AUTO_SCHEDULER.schedule(chat_id, app)
+        raise
+    await _create_shipments(app.bot, chat_id, orders)
 
-    BUFFERS.pop(chat_id, None)
-    TIMERS.pop(chat_id, None)
 
-    await app.bot.send_message(
-        chat_id=chat_id,
-        text=(
-            f"⏱️ تم المعالجة تلقائيًا بسبب عدم وجود رسائل جديدة.\n"
-            f"عدد الطلبات: {len(orders)}\n\n"
-            f"```json\n{pretty}\n```"
-        ),
-        parse_mode="Markdown"
-    )
+def _timed(name: str, handler):
+    @functools.wraps(handler)
+    async def wrapper(*args):
+        with HANDLER_SECONDS.time(name):
+            await handler(*args)
+
+    return wrapper
+
+
+def _profiled(handler):
+    """إذا PROFILE_DONE_SECONDS مفعّل، نحفظ profile لأي استدعاء أبطأ منه."""
+    if PROFILER is None:
+        return handler
+
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        async with PROFILER.track(f"{handler.__name__}-{update.effective_chat.id}"):
+            await handler(update, context)
+
+    return wrapper
+
+
+AUTO_SCHEDULER = DebounceScheduler(
+    AUTO_PROCESS_SECONDS, _timed("auto_finalize", _auto_finalize), AUTO_PROCESS_WORKERS
+)
 
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
@@ -191,29 +580,172 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not msg:
         return
 
-    BUFFERS.setdefault(chat_id, []).append(msg)
+    try:
+        count = await BUFFER_STORE.append(chat_id, msg)
+    except BufferFullError:
+        BUFFER_FULL.inc()
+        # التحذير جزء من إشعار الاستلام: مرة وحدة لكل تجميع، مو رد لكل رسالة مرفوضة
+        ACKS.note_full(context.bot, chat_id)
+        return
+
+    # نحلل الطلبات المكتملة أول بأول، فـ /done يحلل الذيل بس
+    if count == 1:
+        _prune_streams()
+        STREAMS[chat_id] = OrderStream()
+    stream = STREAMS.get(chat_id)
+    if stream is not None and stream.messages == count - 1:
+        with PARSE_SECONDS.time("feed"):
+            stream.feed(msg)
+    else:
+        STREAMS.pop(chat_id, None)
 
     # خيار المعالجة التلقائية بعد فترة سكون
     if AUTO_PROCESS_SECONDS > 0:
-        old = TIMERS.get(chat_id)
-        if old:
-            old.cancel()
-        TIMERS[chat_id] = asyncio.create_task(_auto_finalize(chat_id, context.application))
+        AUTO_SCHEDULER.schedule(chat_id, context.application)
 
-    await update.message.reply_text("📥 تم استلام الرسالة. أكمل إرسال البقية ثم /done")
+    # إشعار واحد لكل تجميع يتعدل بالعدد بدل رد على كل رسالة
+    ACKS.note(context.bot, chat_id, count, stream.detected() if chat_id in STREAMS else None)
 
 
-def main():
-    app = Application.builder().token(BOT_TOKEN).build()
+def add_handlers(application: Application):
+    application.add_handler(CommandHandler("start", _timed("start", start)))
+    application.add_handler(CommandHandler("done", _timed("done", _profiled(done))))
+    application.add_handler(CommandHandler("cancel", _timed("cancel", cancel)))
+    application.add_handler(CommandHandler("format", _timed("format", set_format)))
+
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, _timed("handle_text", handle_text)))
+
+
+def _observe_outbound(method: str, seconds: float, outcome: str):
+    OUTBOUND_SECONDS.observe(seconds, method, outcome)
+
+
+OUTBOUND.on_call = _observe_outbound
+OUTBOUND.on_sent = OUTBOUND_WAIT_SECONDS.observe
+
 
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(CommandHandler("done", done))
-    app.add_handler(CommandHandler("cancel", cancel))
+@METRICS.collector
+async def _collect_gauges():
+    stats = await BUFFER_STORE.stats()
+    BUFFER_CHATS.set(stats.chats)
+    BUFFER_MESSAGES.set(stats.messages)
+    BUFFER_BYTES.set(stats.bytes)
+    BUFFER_MAX_CHAT_BYTES.set(stats.max_chat_bytes)
+    STREAMS_ACTIVE.set(len(STREAMS))
+    AUTO_PENDING.set(len(AUTO_SCHEDULER))
+    OUTBOUND_PENDING.set(len(OUTBOUND))
 
-    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
 
-    app.run_polling()
+async def _drain(_: Application):
+    """بعد application.stop وقبل shutdown (اللي يسكر client البوت)."""
+    # المعالجات التلقائية اللي سحبت تجميع تكمل، ثم يطلع كل اللي باقي بالطابور
+    await AUTO_SCHEDULER.stop()
+    await OUTBOUND.stop()
+
+
+async def _close(_: Application):
+    await BUFFER_STORE.close()
+    if SHIPMENTS is not None:
+        await SHIPMENTS.aclose()
+
+
+def build_application(webhook: bool) -> Application:
+    """
+    بناء تطبيق البوت.
+    بوضع الـ webhook ما نحتاج Updater لأن التحديثات توصل من السيرفر مباشرة.
+    post_stop/post_shutdown يتنفذون مع run_polling؛ تحت uvicorn الـ lifespan يستدعيهم بنفسه.
+    """
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(CONCURRENT_UPDATES)
+        .post_stop(_drain)
+        .post_shutdown(_close)
+    )
+    if webhook:
+        builder = builder.updater(None)
+    application = builder.build()
+    add_handlers(application)
+    return application
+
+
+def create_app(application: Application) -> Starlette:
+    """
+    تطبيق ASGI يستلم تحديثات تيليجرام عبر POST ويمررها لـ update_queue.
+    إذا التطبيق عنده Updater (وضع polling) نشغل الـ polling بدل الـ webhook، وما نفتح
+    مسار /telegram أصلًا حتى ما يوصل تحديث مزور للبوت الشغال.
+    """
+    webhook = application.updater is None
+
+    async def telegram_webhook(request: Request) -> Response:
+        # compare_digest على str يرمي TypeError لأي حرف غير ASCII، فنقارن bytes
+        # (Starlette يفك الهيدرز latin-1 فالرجوع لـ bytes بدون خسارة)
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "").encode("latin-1")
+        if not WEBHOOK_SECRET or not hmac.compare_digest(token, WEBHOOK_SECRET.encode()):
+            return Response(status_code=403)
+
+        try:
+            data = await request.json()
+        except ValueError:
+            return Response(status_code=400)
+        if not isinstance(data, dict):
+            return Response(status_code=400)
+        # de_json ما يتحقق من الأنواع، فجسم بشكل غلط يرمي AttributeError/TypeError أو يرجع None
+        try:
+            update = Update.de_json(data, application.bot)
+        except (AttributeError, TypeError, ValueError):
+            update = None
+        if update is None:
+            return Response(status_code=400)
+
+        await application.update_queue.put(update)
+        return Response()
+
+    async def metrics(request: Request) -> Response:
+        token = request.headers.get("Authorization", "").encode("latin-1")
+        if METRICS_TOKEN and not hmac.compare_digest(token, f"Bearer {METRICS_TOKEN}".encode()):
+            return Response(status_code=403)
+        return Response(await METRICS.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+    @asynccontextmanager
+    async def lifespan(_: Starlette):
+        await application.initialize()
+        if application.updater:
+            await application.updater.start_polling()
+        elif WEBHOOK_URL:
+            await application.bot.set_webhook(
+                url=WEBHOOK_URL + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET or None,
+                allowed_updates=Update.ALL_TYPES,
+            )
+        await application.start()
+        try:
+            yield
+        finally:
+            # الترتيب مهم: shutdown يسكر client البوت، فلازم قبله يخلص كل شي يرسل
+            if application.updater and application.updater.running:
+                await application.updater.stop()
+            # handlers الشغالة تكمل (stop ينتظرها) وبعدها ما توصل جدولة جديدة
+            await application.stop()
+            await _drain(application)
+            await application.shutdown()
+            await _close(application)
+
+    routes = [Route(METRICS_PATH, metrics, methods=["GET"])]
+    if webhook:
+        routes.append(Route(WEBHOOK_PATH, telegram_webhook, methods=["POST"]))
+    return Starlette(routes=routes, lifespan=lifespan)
+
+
+# uvicorn main:app (Procfile)، أو python main.py للـ polling
+application = build_application(webhook=BOT_MODE == "webhook")
+app = create_app(application)
+
+
+def main():
+    # نفس التطبيق ونفس خطوات الإيقاف (post_stop/post_shutdown) اللي يسويها الـ lifespan
+    application.run_polling()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
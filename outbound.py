@@ -0,0 +1,358 @@
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from telegram import Bot
+from telegram.error import BadRequest, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# الأولوية: الرقم الأصغر ينرسل أول
+PRIORITY_RESULT = 0  # نتائج /done وردود الأوامر
+PRIORITY_STATUS = 1  # تحديث حالة الشحنات
+PRIORITY_ACK = 2  # إشعار استلام الرسائل
+
+Call = Callable[[], Awaitable[Any]]
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """كم ثانية لازم ننتظر حتى يتوفر token."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+    def pause(self, seconds: float, now: float):
+        """تيليجرام رجع RetryAfter: نفرغ الدلو بحيث أول token يتوفر بعد seconds."""
+        self._refill(now)
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+
+class _Job:
+    __slots__ = ("chat_id", "call", "future", "enqueued", "method")
+
+    def __init__(self, chat_id: int, call: Call, future: asyncio.Future, enqueued: float, method: str):
+        self.chat_id = chat_id
+        self.call = call
+        self.future = future
+        self.enqueued = enqueued
+        self.method = method
+
+
+class OutboundQueue:
+    """
+    كل طلبات الإرسال لتيليجرام تمر من هنا.
+    - token bucket عام (حد البوت) وواحد لكل محادثة (حد المحادثة، والمجموعات أبطأ).
+    - heap بالأولوية، ونفس المحادثة تنرسل رسائلها بالترتيب ووحدة وحدة.
+    - RetryAfter يوقف المحادثة للمدة المطلوبة ويرجع الطلب للطابور.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30,
+        chat_rate: float = 1,
+        chat_burst: float = 3,
+        group_rate: float = 20 / 60,
+        max_in_flight: int = 32,
+    ):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_in_flight = max_in_flight
+        self._heap: List = []
+        self._seq = itertools.count()
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._busy: Set[int] = set()
+        self._global: Optional[TokenBucket] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+        self._last_prune = 0.0
+        self.on_sent: Optional[Callable[[float], None]] = None  # يستلم زمن الانتظار بالطابور
+        self.on_call: Optional[Callable[[str, float, str], None]] = None  # (method، المدة، ok/retry/error)
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def _start(self):
+        loop = asyncio.get_running_loop()
+        self._global = TokenBucket(self.global_rate, self.global_rate, loop.time())
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def _bucket(self, chat_id: int, now: float) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            rate = self.group_rate if chat_id < 0 else self.chat_rate
+            bucket = self._buckets[chat_id] = TokenBucket(rate, self.chat_burst, now)
+        return bucket
+
+    def submit(
+        self, chat_id: int, call: Call, priority: int = PRIORITY_RESULT, method: str = "call"
+    ) -> asyncio.Future:
+        if self._task is None:
+            self._start()
+        loop = asyncio.get_running_loop()
+        job = _Job(chat_id, call, loop.create_future(), time.monotonic(), method)
+        heapq.heappush(self._heap, (priority, next(self._seq), job))
+        self._wakeup.set()
+        return job.future
+
+    async def call(self, chat_id: int, call: Call, priority: int = PRIORITY_RESULT, method: str = "call"):
+        return await self.submit(chat_id, call, priority, method)
+
+    def via(self, bot: Bot, priority: int = PRIORITY_RESULT) -> "QueuedBot":
+        return QueuedBot(self, bot, priority)
+
+    def _pick(self, now: float):
+        """أول طلب (حسب الأولوية) محادثته جاهزة. يرجع (الطلب، أقل وقت انتظار)."""
+        skipped = []
+        found = None
+        wait = float("inf")
+        while self._heap:
+            item = heapq.heappop(self._heap)
+            job = item[2]
+            if job.future.cancelled():
+                continue  # اللي طلبه انلغى (مثلًا إيقاف السيرفر) قبل ما يوصل دوره
+            if job.chat_id in self._busy:
+                skipped.append(item)
+                continue
+            w = self._bucket(job.chat_id, now).wait_time(now)
+            if w > 0:
+                wait = min(wait, w)
+                skipped.append(item)
+                continue
+            found = item
+            break
+        for item in skipped:
+            heapq.heappush(self._heap, item)
+        return found, wait
+
+    async def _sleep(self, timeout: Optional[float]):
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._heap or len(self._busy) >= self.max_in_flight:
+                await self._sleep(None)
+                continue
+
+            now = loop.time()
+            wait = self._global.wait_time(now)
+            if wait > 0:
+                await self._sleep(wait)
+                continue
+
+            item, wait = self._pick(now)
+            if item is None:
+                await self._sleep(None if wait == float("inf") else wait)
+                continue
+
+            job = item[2]
+            self._global.take(now)
+            self._bucket(job.chat_id, now).take(now)
+            self._busy.add(job.chat_id)
+            task = asyncio.create_task(self._execute(item))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _execute(self, item):
+        priority, seq, job = item
+        loop = asyncio.get_running_loop()
+        outcome = "ok"
+        started = time.monotonic()
+        try:
+            if self.on_sent is not None:
+                self.on_sent(started - job.enqueued)
+            result = await job.call()
+        except RetryAfter as e:
+            outcome = "retry"
+            # نفس الترتيب (seq) حتى يرجع لمكانه بالطابور
+            self._bucket(job.chat_id, loop.time()).pause(float(e.retry_after), loop.time())
+            heapq.heappush(self._heap, item)
+        except asyncio.CancelledError:
+            job.future.cancel()
+            raise
+        except Exception as e:
+            outcome = "error"
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            if self.on_call is not None:
+                self.on_call(job.method, time.monotonic() - started, outcome)
+            self._busy.discard(job.chat_id)
+            self._prune_buckets(loop.time())
+            self._wakeup.set()
+
+    def _prune_buckets(self, now: float):
+        # دلو ممتلئ ما يفرق عن دلو جديد، فنحذفه حتى ما تكبر الذاكرة مع المحادثات
+        if len(self._buckets) < 4096 or now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        for chat_id in [c for c, b in self._buckets.items() if c not in self._busy and b.full(now)]:
+            del self._buckets[chat_id]
+
+    async def stop(self, timeout: float = 30.0):
+        """يرسل اللي باقي بالطابور (لحد timeout، بنفس حدود الإرسال) ثم يوقف."""
+        if self._task is not None:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + timeout
+            while (self._heap or self._running) and loop.time() < deadline:
+                await asyncio.sleep(0.05)
+            if self._heap or self._running:
+                logger.warning("outbound queue stopped with %d pending calls", len(self._heap) + len(self._running))
+            self._task.cancel()
+            for task in self._running:
+                task.cancel()
+            await asyncio.gather(self._task, *self._running, return_exceptions=True)
+            self._task = None
+        for _, _, job in self._heap:
+            job.future.cancel()
+        self._heap = []
+
+
+class QueuedBot:
+    """واجهة مثل Bot بس كل طلب يمر من OutboundQueue بأولوية ثابتة."""
+
+    def __init__(self, queue: OutboundQueue, bot: Bot, priority: int):
+        self.queue = queue
+        self.bot = bot
+        self.priority = priority
+
+    async def send_message(self, chat_id: int, **kwargs):
+        return await self.queue.call(
+            chat_id, lambda: self.bot.send_message(chat_id=chat_id, **kwargs), self.priority, "send_message"
+        )
+
+    async def send_document(self, chat_id: int, **kwargs):
+        return await self.queue.call(
+            chat_id, lambda: self.bot.send_document(chat_id=chat_id, **kwargs), self.priority, "send_document"
+        )
+
+    async def edit_message_text(self, text: str, chat_id: int, message_id: int, **kwargs):
+        return await self.queue.call(
+            chat_id,
+            lambda: self.bot.edit_message_text(text, chat_id=chat_id, message_id=message_id, **kwargs),
+            self.priority,
+            "edit_message_text",
+        )
+
+
+class _AckState:
+    __slots__ = ("bot", "message_id", "text", "messages", "orders", "full", "pending", "updated_at")
+
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.message_id: Optional[int] = None
+        self.text = ""
+        self.messages = 0
+        self.orders: Optional[int] = None
+        self.full = False  # انرفضت رسالة لأن التجميع وصل الحد
+        self.pending = False
+        self.updated_at = time.monotonic()
+
+
+class AckCoalescer:
+    """
+    إشعار استلام واحد لكل تجميع يتعدل بمكانه بدل رسالة لكل رسالة.
+    بأي وقت فيه تعديل واحد بالطابور كحد أقصى، ويقرأ آخر عدد لما يتنفذ.
+    render(messages, orders, full) يرجع نص الإشعار.
+    """
+
+    def __init__(self, queue: OutboundQueue, render: Callable[[int, Optional[int], bool], str]):
+        self.queue = queue
+        self.render = render
+        self._chats: Dict[int, _AckState] = {}
+
+    def note(self, bot: Bot, chat_id: int, messages: int, orders: Optional[int] = None):
+        state = self._state(bot, chat_id)
+        state.messages = messages
+        state.orders = orders
+        self._touch(chat_id, state)
+
+    def note_full(self, bot: Bot, chat_id: int):
+        """
+        رسالة انرفضت لأن التجميع ممتلئ. التحذير ينضاف لنفس الإشعار، فيطلع مرة وحدة
+        لكل تجميع مهما تكررت الرسائل المرفوضة (النص ما يتغير فما يتعدل).
+        """
+        state = self._state(bot, chat_id)
+        state.full = True
+        self._touch(chat_id, state)
+
+    def _state(self, bot: Bot, chat_id: int) -> _AckState:
+        state = self._chats.get(chat_id)
+        if state is None:
+            state = self._chats[chat_id] = _AckState(bot)
+        return state
+
+    def _touch(self, chat_id: int, state: _AckState):
+        state.updated_at = time.monotonic()
+        if not state.pending:
+            state.pending = True
+            future = self.queue.submit(chat_id, lambda: self._flush(chat_id, state), PRIORITY_ACK, "ack")
+            future.add_done_callback(self._log_failure)
+
+    @staticmethod
+    def _log_failure(future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning("ack update failed: %s", future.exception())
+
+    async def _flush(self, chat_id: int, state: _AckState):
+        # من هنا أي رسالة جديدة تطلب تعديل جديد
+        state.pending = False
+        if self._chats.get(chat_id) is not state:
+            return  # انعمل /done أو /cancel
+        text = self.render(state.messages, state.orders, state.full)
+        if text == state.text:
+            return
+        try:
+            if state.message_id is None:
+                message = await state.bot.send_message(chat_id=chat_id, text=text)
+                state.message_id = message.message_id
+            else:
+                await state.bot.edit_message_text(text, chat_id=chat_id, message_id=state.message_id)
+            state.text = text
+        except RetryAfter:
+            state.pending = True  # الطابور يعيد المحاولة
+            raise
+        except BadRequest as e:
+            logger.warning("ack update failed for chat %s: %s", chat_id, e)
+
+    def reset(self, chat_id: int):
+        self._chats.pop(chat_id, None)
+
+    def prune(self, max_idle: float):
+        cutoff = time.monotonic() - max_idle
+        for chat_id in [c for c, s in self._chats.items() if s.updated_at < cutoff]:
+            del self._chats[chat_id]
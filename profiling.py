@@ -0,0 +1,97 @@
+import os
+import sys
+import time
+import logging
+import threading
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Sample = Tuple[float, Tuple[str, ...]]  # (الوقت، الـ stack من الجذر للأعمق)
+
+
+class SlowCallProfiler:
+    """
+    Profiler بالعينات لحلقة asyncio: thread جانبي يقرأ stack الـ thread الرئيسي كل interval
+    ما دام فيه استدعاء متتبع شغال. إذا طلع الاستدعاء أبطأ من threshold، نكتب عيناته
+    بصيغة folded (سطر لكل stack + عدده) تنفتح بـ flamegraph.pl أو speedscope.
+
+    العينات تشمل أي coroutine ثاني شغال على نفس الحلقة بنفس الفترة، وهذا مقصود:
+    بطء /done أحيانًا سببه شغل ثاني ماسك الحلقة.
+    """
+
+    def __init__(self, threshold: float, directory: str, interval: float = 0.005, max_samples: int = 200_000):
+        self.threshold = threshold
+        self.directory = directory
+        self.interval = interval
+        self._samples: Deque[Sample] = deque(maxlen=max_samples)
+        self._active = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._target: Optional[int] = None
+
+    def _stack(self) -> Optional[Tuple[str, ...]]:
+        frame = sys._current_frames().get(self._target)
+        if frame is None:
+            return None
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        stack.reverse()
+        return tuple(stack)
+
+    def _sample_loop(self):
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+            stack = self._stack()
+            if stack:
+                self._samples.append((time.monotonic(), stack))
+            time.sleep(self.interval)
+
+    def _enter(self):
+        with self._lock:
+            self._active += 1
+            self._target = threading.get_ident()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+                self._thread.start()
+
+    def _exit(self):
+        with self._lock:
+            self._active -= 1
+            if not self._active:
+                # ما نحتاج العينات القديمة إذا ما فيه استدعاء شغال
+                self._samples.clear()
+
+    def dump(self, name: str, start: float, end: float) -> Optional[str]:
+        stacks = Counter(stack for at, stack in list(self._samples) if start <= at <= end)
+        if not stacks:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{name}-{int(time.time() * 1000)}.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(";".join(stack) + f" {count}\n")
+        return path
+
+    @asynccontextmanager
+    async def track(self, name: str):
+        self._enter()
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            end = time.monotonic()
+            try:
+                if end - start >= self.threshold:
+                    path = self.dump(name, start, end)
+                    logger.warning("%s took %.2fs, profile: %s", name, end - start, path)
+            finally:
+                self._exit()
@@ -0,0 +1,115 @@
+import heapq
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[int, Any], Awaitable[None]]
+
+
+class DebounceScheduler:
+    """
+    مؤقت مركزي للمعالجة التلقائية بعد فترة سكون.
+    بدل Task نايمة لكل محادثة: heap للمواعيد + Task وحدة تصحى على أقرب موعد،
+    والمحادثات اللي خلص وقتها تروح لعدد ثابت من الـ workers.
+
+    إعادة الجدولة O(log n): نضيف موعد جديد للـ heap ونخلي القديم يتجاهل لما يطلع.
+    """
+
+    def __init__(self, delay: float, handler: Handler, workers: int = 8):
+        self.delay = delay
+        self.handler = handler
+        self.workers = max(1, workers)
+        self._deadlines: Dict[int, Tuple[float, Any]] = {}  # chat_id -> (الموعد، data)
+        self._heap: List[Tuple[float, int]] = []
+        self._queue: Optional[asyncio.Queue] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._next_wake = float("inf")
+        self._tasks: List[asyncio.Task] = []
+        self._closed = False
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def _start(self):
+        self._queue = asyncio.Queue(maxsize=self.workers * 4)
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._timer())]
+        self._tasks += [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def schedule(self, chat_id: int, data: Any = None):
+        """يأجل معالجة المحادثة لـ delay ثواني من الآن (يلغي الموعد السابق)."""
+        if self._closed:
+            return  # بعد stop التجميع يبقى بالمخزن لحد /done أو رسالة جديدة
+        if not self._tasks:
+            self._start()
+        deadline = asyncio.get_running_loop().time() + self.delay
+        self._deadlines[chat_id] = (deadline, data)
+        heapq.heappush(self._heap, (deadline, chat_id))
+
+        # الـ heap يتراكم بيه مواعيد قديمة، نعيد بناءه إذا صارت أكثر من النص
+        if len(self._heap) > 2 * len(self._deadlines) + 64:
+            self._heap = [(d, c) for c, (d, _) in self._deadlines.items()]
+            heapq.heapify(self._heap)
+
+        if deadline < self._next_wake:
+            self._wakeup.set()
+
+    def cancel(self, chat_id: int):
+        self._deadlines.pop(chat_id, None)
+
+    async def _timer(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            while self._heap and self._heap[0][0] <= now:
+                deadline, chat_id = heapq.heappop(self._heap)
+                entry = self._deadlines.get(chat_id)
+                # موعد قديم (انعادت جدولته أو انلغى)
+                if entry is None or entry[0] != deadline:
+                    continue
+                del self._deadlines[chat_id]
+                await self._queue.put((chat_id, entry[1]))
+
+            self._next_wake = self._heap[0][0] if self._heap else float("inf")
+            self._wakeup.clear()
+            timeout = None if not self._heap else max(0.0, self._next_wake - loop.time())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self):
+        while True:
+            chat_id, data = await self._queue.get()
+            try:
+                # إذا وصلت رسالة جديدة بعد ما طلع الموعد، الموعد الجديد هو اللي يعالج
+                if chat_id not in self._deadlines:
+                    await self.handler(chat_id, data)
+            except Exception:
+                logger.exception("auto finalize failed for chat %s", chat_id)
+            finally:
+                self._queue.task_done()
+
+    async def stop(self, timeout: float = 30.0):
+        """
+        يوقف المؤقت، ويخلي الـ workers يكملون المحادثات اللي طلع موعدها (لحد timeout)
+        قبل ما يلغيهم، حتى ما ينقطع تجميع انسحب من المخزن بنص المعالجة.
+        """
+        self._closed = True
+        if self._tasks:
+            timer, workers = self._tasks[0], self._tasks[1:]
+            timer.cancel()
+            await asyncio.gather(timer, return_exceptions=True)
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("auto finalize still running after %.0fs, cancelling", timeout)
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        self._tasks = []
+        self._deadlines.clear()
+        self._heap = []
+        self._next_wake = float("inf")
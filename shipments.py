@@ -0,0 +1,174 @@
+import time
+import random
+import asyncio
+import hashlib
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# الحالات اللي تستاهل إعادة محاولة: ضغط على السيرفر أو خطأ مؤقت
+RETRY_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+ProgressCallback = Callable[[int, int, int], Awaitable[None]]  # (done, total, failed)
+
+
+class ShipmentError(Exception):
+    """فشل إنشاء الشحنة بعد كل المحاولات أو رفضها الـ API."""
+
+
+def idempotency_key(order: Dict) -> str:
+    """
+    مفتاح ثابت لكل طلب: الهاتف (مطبّع من parse_orders) + النص الخام.
+    نفس الطلب يعطي نفس المفتاح بكل محاولة، فشركة الشحن ما تنشئ شحنة مكررة.
+    """
+    data = f"{order['phone']}\n{order['raw']}".encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+class ShipmentResult:
+    __slots__ = ("order", "shipment", "error")
+
+    def __init__(self, order: Dict, shipment: Optional[Dict] = None, error: str = ""):
+        self.order = order
+        self.shipment = shipment
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.shipment is not None
+
+
+class ShipmentPipeline:
+    """
+    إنشاء الشحنات عبر API شركة الشحن بالتوازي.
+    - client واحد مشترك (connection pool) لكل الطلبات.
+    - حد للطلبات المتزامنة، ودفعات إذا batch_size > 1 (POST /shipments/batch).
+    - إعادة محاولة مع backoff، ونفس Idempotency-Key بكل محاولة.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        token: str = "",
+        concurrency: int = 16,
+        batch_size: int = 1,
+        max_retries: int = 4,
+        backoff: float = 0.5,
+        timeout: float = 20.0,
+        progress_interval: float = 1.0,
+        max_retry_after: float = 60.0,
+    ):
+        self.concurrency = max(1, concurrency)
+        self.batch_size = max(1, batch_size)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_retry_after = max_retry_after
+        self.progress_interval = progress_interval
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        self._client = httpx.AsyncClient(
+            base_url=base_url.rstrip("/"),
+            headers=headers,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+        )
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    def _delay(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        if response is not None:
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.replace(".", "", 1).isdigit():
+                # Retry-After كبير (مثلًا ساعة) يوقف الطلب كل هالمدة، فنحدده
+                return min(float(retry_after), self.max_retry_after)
+        # backoff أسي مع jitter حتى ما ترجع كل المحاولات بنفس اللحظة
+        return self.backoff * (2 ** attempt) * (0.5 + random.random())
+
+    async def _post(self, path: str, payload, key: str):
+        response = None
+        error = ""
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(self._delay(attempt - 1, response))
+            try:
+                response = await self._client.post(path, json=payload, headers={"Idempotency-Key": key})
+            except httpx.TransportError as e:
+                response = None
+                error = f"{type(e).__name__}: {e}"
+                continue
+            except httpx.HTTPError as e:
+                # مو خطأ شبكة مؤقت (TooManyRedirects، DecodingError...): إعادة المحاولة ما تفيد
+                raise ShipmentError(f"{type(e).__name__}: {e}")
+
+            if response.status_code in RETRY_STATUS:
+                error = f"HTTP {response.status_code}"
+                continue
+            if response.is_error:
+                raise ShipmentError(f"HTTP {response.status_code}: {response.text[:200]}")
+            try:
+                return response.json()
+            except ValueError:
+                raise ShipmentError(f"invalid JSON response: {response.text[:200]}")
+
+        raise ShipmentError(error)
+
+    async def create_shipment(self, order: Dict) -> Dict:
+        key = idempotency_key(order)
+        return await self._post("/shipments", {**order, "idempotencyKey": key}, key)
+
+    async def create_batch(self, orders: List[Dict]) -> List[Dict]:
+        items = [{**o, "idempotencyKey": idempotency_key(o)} for o in orders]
+        key = hashlib.sha256("".join(i["idempotencyKey"] for i in items).encode()).hexdigest()
+        shipments = await self._post("/shipments/batch", items, key)
+        if not isinstance(shipments, list) or len(shipments) != len(orders):
+            raise ShipmentError("batch response does not match request")
+        return shipments
+
+    async def submit(self, orders: List[Dict], progress: Optional[ProgressCallback] = None) -> List[ShipmentResult]:
+        """إنشاء شحنة لكل طلب. النتائج بنفس ترتيب الطلبات."""
+        results: List[Optional[ShipmentResult]] = [None] * len(orders)
+        batches = [range(i, min(i + self.batch_size, len(orders))) for i in range(0, len(orders), self.batch_size)]
+        limit = asyncio.Semaphore(self.concurrency)
+        counts = {"done": 0, "failed": 0}
+        last_report = 0.0
+
+        async def report(final: bool = False):
+            nonlocal last_report
+            now = time.monotonic()
+            if progress is None or (not final and now - last_report < self.progress_interval):
+                return
+            last_report = now
+            try:
+                await progress(counts["done"], len(orders), counts["failed"])
+            except Exception:
+                # تحديث الحالة ما لازم يوقف إنشاء الشحنات
+                logger.exception("shipment progress callback failed")
+
+        async def run(batch: range):
+            chunk = [orders[i] for i in batch]
+            async with limit:
+                try:
+                    if self.batch_size > 1:
+                        shipments = await self.create_batch(chunk)
+                    else:
+                        shipments = [await self.create_shipment(chunk[0])]
+                    done = [ShipmentResult(o, shipment=s) for o, s in zip(chunk, shipments)]
+                except ShipmentError as e:
+                    done = [ShipmentResult(o, error=str(e)) for o in chunk]
+                except Exception as e:
+                    # خطأ غير متوقع يفشّل هذي الدفعة بس، مو كل gather
+                    logger.exception("shipment batch failed")
+                    done = [ShipmentResult(o, error=f"{type(e).__name__}: {e}") for o in chunk]
+
+            for i, result in zip(batch, done):
+                results[i] = result
+            counts["done"] += len(done)
+            counts["failed"] += sum(1 for r in done if not r.ok)
+            await report()
+
+        await asyncio.gather(*(run(b) for b in batches))
+        await report(final=True)
+        return results
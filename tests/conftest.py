@@ -0,0 +1,10 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))  # مولد اللصقات المصطنعة (bench_parse.make_paste)
+
+# main يقرأ الإعدادات وقت الاستيراد
+os.environ.setdefault("BOT_TOKEN", "test")
+os.environ.setdefault("WEBHOOK_SECRET", "test")
@@ -0,0 +1,26 @@
+import asyncio
+
+import pytest
+
+from buffers import BufferFullError, MemoryBufferStore, SQLiteBufferStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        store = MemoryBufferStore(max_bytes=4)
+    else:
+        store = SQLiteBufferStore(str(tmp_path / "buffers.db"), max_bytes=4)
+    yield store
+    asyncio.run(store.close())
+
+
+def test_rejected_first_message_leaves_no_buffer(store):
+    async def run():
+        with pytest.raises(BufferFullError):
+            await store.append(1, "too long")
+        assert (await store.stats()).chats == 0
+        assert await store.append(1, "ok") == 1
+        assert (await store.stats()).chats == 1
+
+    asyncio.run(run())
@@ -0,0 +1,35 @@
+"""
+OrderStream لازم يطابق parse_orders على نفس الرسائل مجموعة، مهما كان مكان تقطيع الرسائل
+(حتى وسط رقم الهاتف أو التسمية).
+"""
+import random
+
+import pytest
+
+import main
+from bench_incremental import random_messages, stream_orders
+from bench_parse import make_paste
+
+SEED = 1
+
+
+@pytest.mark.parametrize("case", range(300))
+def test_random_splits_match_parse_orders(case):
+    rnd = random.Random(SEED * 1000 + case)
+    text = make_paste(rnd.randint(0, 12), SEED * 1000 + case)
+    messages = random_messages(text, rnd.randint(1, 40), rnd)
+
+    stream = stream_orders(messages)
+
+    assert stream.finish() == main.parse_orders("\n".join(messages).strip())
+    assert stream.matches(messages)
+
+
+def test_matches_rejects_other_messages():
+    stream = stream_orders(["اسم: علي", "07712345678"])
+    assert not stream.matches(["اسم: علي", "07712345679"])
+    assert not stream.matches(["اسم: علي"])
+
+
+def test_finish_without_messages_is_empty():
+    assert main.OrderStream().finish() == []